@@ -1,4 +1,5 @@
 #pylint: disable=unused-import
 
 from .families import make as make_families
+from .families import make_batch as make_families_batch
 from .families import breakup as break_families
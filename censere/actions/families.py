@@ -22,15 +22,9 @@ LOGGER = logging.getLogger("c.a.families")
 DEVLOG = logging.getLogger("d.devel")
 
 ##
-# Make a single new family out of two singles
-# the caller is responsible for calling this at
-# appropriate times...
-# This may not create a family if there are no compatible singles
-#
-# \param args - not normally used, but required for pytest benchmarking
-def make(*args ):
-
-    LOGGER.log( logging.INFO, '%d.%d (%d) Trying to make a new family', *UTILS.from_soldays( thisApp.solday ), thisApp.solday )
+# The query that finds a pair of compatible singles
+# Kept separate so that `mars-censere db optimize` can explain it
+def candidates_query( ):
 
     partner = MODELS.Settler.alias()
 
@@ -68,138 +62,220 @@ def make(*args ):
                 # both over 18 earth years years
                 ( MODELS.Settler.birth_solday < (thisApp.solday - UTILS.years_to_sols(18) ) ) &
                 ( partner.birth_solday < (thisApp.solday - UTILS.years_to_sols(18) ) ) &
-                # Call out to application policy to decide if this is allowed
-                # Now implemented a LRU cache as this can get expensive
-                # when its called for the same people every day
-                ( peewee.fn.app_family_policy( thisApp.common_ancestor, MODELS.Settler.settler_id, partner.settler_id ) == True)
+                # Call out to the application policies (see models/policies.py)
+                # to decide if this is allowed
+                ( peewee.fn.app_pair_policy( MODELS.Settler.settler_id, partner.settler_id ) == True)
             ).order_by(
 # a UUID is close to random and doesn't need to be calculated
-                MODELS.Settler.settler_id
+                MODELS.Settler.settler_id,
+                # tie-break on the partner explicitly, otherwise the partner
+                # chosen depends on which index the planner happens to use
+                partner.id
                 # MODELS.Settler.first_name, partner.first_name
             ).limit(1).dicts()
 
+    return query
 
-    num_relationships = 0
+##
+# Describe a pair from the pool the way candidates_query() does
+def pool_row( pair ):
+
+    row = {}
+
+    for ( n, settler_id ) in enumerate( pair, start=1 ):
+
+        details = MODELS.SINGLES.details( settler_id )
+
+        row[ f"userid{n}" ] = settler_id
+        row[ f"first_name{n}" ] = details["first_name"]
+        row[ f"family_name{n}" ] = details["family_name"]
+        row[ f"sex{n}" ] = details["sex"]
+
+    return row
+
+##
+# Find a pair of compatible singles from the in-memory pool.
+# Same result (and row format) as candidates_query()
+def candidates_pool( ):
+
+    pair = MODELS.SINGLES.find_pair(
+        thisApp.solday - UTILS.years_to_sols(18),
+        UTILS.years_to_sols(thisApp.partner_max_age_difference),
+        MODELS.FAMILY_POLICY.check )
+
+    if pair is None:
+        return []
+
+    return [ pool_row( pair ) ]
+
+##
+# Everything that follows two singles becoming a couple,
+# the end of the relationship and possibly a child
+#
+# \param row - the pair, as returned by candidates_query()
+# \param relationship_id - of their (already saved) relationship
+def start_family( row, relationship_id ):
+
+    relationship_length = RANDOM.parse_random_value( thisApp.relationship_length)
+    relationship_ends = thisApp.solday + relationship_length
+
+    EVENTS.register_callback(
+        when= relationship_ends,
+        callback_func=CALLBACKS.end_relationship,
+        kwargs= { "relationship_id" : relationship_id, "simulation": thisApp.simulation }
+    )
+
+    # TODO
+    # this seems like a reasonable assumption... if the relationship is shorter than
+    # the delay before first child then no children. not biologically required
+    # but seems reasonable at this level of sophistication
+    #if relationship_length < RANDOM.parse_random_value( thisApp.first_child_delay):
+    #    return
+
+    #
+    # Doing it here allows us to make children event based - registering next steps
+    # when a step completes and we don't have to handle "cool off" state as
+    # a special case
+
+    # basic pregnancy steps might be:
+    #   reduce productivity after Y months
+    #   maternity leave after 8 - for X time
+    #   reset productivity after Z as ML ends
+    #   paternity leave ? what impact for "frontier" settlements ?
+    # those should all be configurable - we don't trigger them all here
+    # so that we can model early failures (mothers death or miscariages)
+
+    mother=None
+    father=None
+    if row['sex1'] != row['sex2']:
+        if row['sex1'] == "f":
+            mother = row['userid1']
+            father = row['userid2']
+        else:
+            mother = row['userid2']
+            father = row['userid1']
+    else:
+        # TODO - this needs to handle surrogate mothers (and fathers)
+        pass
+
+    if mother and father:
+        m = MODELS.RESIDENTS.get( mother )
+
+        mothers_age = int( (thisApp.solday - m.birth_solday) / 668 )
+
+        # TODO What percentage of relationships have children ?
+        if RANDOM.random() < thisApp.fraction_relationships_having_children :
+            r = RANDOM.random()
+
+            # TODO - need to confirm IFV rate - assume best case
+            # scenario of freezing eggs before leaving earth
+            if (
+                mothers_age < 36 and r < 0.7
+               ) or (
+                mothers_age < 38 and r < 0.2
+               ) or (
+                mothers_age <= 40 and r < 0.05
+               ) or (
+                thisApp.use_ivf and ( mothers_age <= 45 and r < 0.4 ) ):
+
+                birth_day = thisApp.solday + RANDOM.parse_random_value( thisApp.first_child_delay)
+
+                # if the mother is already pregnant (from a previous relationship) then
+                # add an extra delay.
+                if m.pregnant:
+                    birth_day += 668
+
+                LOGGER.log( thisApp.NOTICE, '%d.%03d %s %s and %s %s (%s,%s) are expecting a child on %d.%03d',
+                    *UTILS.from_soldays( thisApp.solday ),
+                    row['first_name1'], row['family_name1'],
+                    row['first_name2'], row['family_name2'],
+                    mother, father,
+                    *UTILS.from_soldays( birth_day )
+                )
+
+                MODELS.RESIDENTS.set_pregnant( mother, True )
+
+                # register a function to be called at `when`
+                EVENTS.register_callback(
+                    when= birth_day,
+                    callback_func=CALLBACKS.settler_born,
+                    kwargs= {
+                        "biological_mother" : mother,
+                        "biological_father": father,
+                        "simulation": thisApp.simulation
+                    }
+                )
+
+##
+# Make a single new family out of two singles
+# the caller is responsible for calling this at
+# appropriate times...
+# This may not create a family if there are no compatible singles
+#
+# \param args - not normally used, but required for pytest benchmarking
+def make(*args ):
 
-    for row in query.execute():
+    LOGGER.log( logging.INFO, '%d.%d (%d) Trying to make a new family', *UTILS.from_soldays( thisApp.solday ), thisApp.solday )
+
+    if thisApp.pairing == 'sql':
+        # the query needs the settlers' state to be up to date
+        MODELS.DOMAIN.flush()
 
-        # rely on triggers to update settler state to couple
+        candidates = candidates_query().execute()
+    else:
+        candidates = candidates_pool()
 
-        r = MODELS.Relationship()
+    num_relationships = 0
 
-        r.simulation_id = thisApp.simulation
+    for row in candidates:
 
-        r.relationship_id= RANDOM.id()
-        r.first=row['userid1']
-        r.second=row['userid2']
-        r.relationship=MODELS.RelationshipEnum.partner
-        r.begin_solday=thisApp.solday
+        relationship_id = RANDOM.id()
 
         LOGGER.log( logging.INFO, '%d.%d Creating family between %s %s and %s %s',
             *UTILS.from_soldays( thisApp.solday ),
             row['first_name1'], row['family_name1'], row['first_name2'], row['family_name2'] )
 
-        r.save()
-
-        relationship_length = RANDOM.parse_random_value( thisApp.relationship_length)
-        relationship_ends = thisApp.solday + relationship_length
+        MODELS.DOMAIN.partnership_started( relationship_id, row['userid1'], row['userid2'] )
 
-        EVENTS.register_callback(
-            when= relationship_ends,
-            callback_func=CALLBACKS.end_relationship,
-            kwargs= { "relationship_id" : r.relationship_id, "simulation": thisApp.simulation }
-        )
+        start_family( row, relationship_id )
 
         num_relationships += 1
 
-        # TODO
-        # this seems like a reasonable assumption... if the relationship is shorter than
-        # the delay before first child then no children. not biologically required
-        # but seems reasonable at this level of sophistication
-        #if relationship_length < RANDOM.parse_random_value( thisApp.first_child_delay):
-        #    return
-
-        #
-        # Doing it here allows us to make children event based - registering next steps
-        # when a step completes and we don't have to handle "cool off" state as
-        # a special case
-
-        # basic pregnancy steps might be:
-        #   reduce productivity after Y months
-        #   maternity leave after 8 - for X time
-        #   reset productivity after Z as ML ends
-        #   paternity leave ? what impact for "frontier" settlements ?
-        # those should all be configurable - we don't trigger them all here
-        # so that we can model early failures (mothers death or miscariages)
-
-        mother=None
-        father=None
-        if row['sex1'] != row['sex2']:
-            if row['sex1'] == "f":
-                mother = row['userid1']
-                father = row['userid2']
-            else:
-                mother = row['userid2']
-                father = row['userid1']
-        else:
-            # TODO - this needs to handle surrogate mothers (and fathers)
-            pass
-
-        if mother and father:
-            m = MODELS.Settler.get( ( MODELS.Settler.settler_id == str(mother) ) & ( MODELS.Settler.simulation_id == thisApp.simulation ) )
-
-            mothers_age = int( (thisApp.solday - m.birth_solday) / 668 )
-
-            # TODO What percentage of relationships have children ?
-            if RANDOM.random() < thisApp.fraction_relationships_having_children :
-                r = RANDOM.random()
-
-                # TODO - need to confirm IFV rate - assume best case
-                # scenario of freezing eggs before leaving earth
-                if (
-                    mothers_age < 36 and r < 0.7
-                   ) or (
-                    mothers_age < 38 and r < 0.2
-                   ) or (
-                    mothers_age <= 40 and r < 0.05
-                   ) or (
-                    thisApp.use_ivf and ( mothers_age <= 45 and r < 0.4 ) ):
-
-                    birth_day = thisApp.solday + RANDOM.parse_random_value( thisApp.first_child_delay)
-
-                    # if the mother is already pregnant (from a previous relationship) then
-                    # add an extra delay.
-                    if m.pregnant:
-                        birth_day += 668
-
-                    LOGGER.log( thisApp.NOTICE, '%d.%03d %s %s and %s %s (%s,%s) are expecting a child on %d.%03d',
-                        *UTILS.from_soldays( thisApp.solday ),
-                        row['first_name1'], row['family_name1'],
-                        row['first_name2'], row['family_name2'],
-                        mother, father,
-                        *UTILS.from_soldays( birth_day )
-                    )
-
-                    m.pregnant = True
-                    m.save()
-
-                    # register a function to be called at `when`
-                    EVENTS.register_callback(
-                        when= birth_day,
-                        callback_func=CALLBACKS.settler_born,
-                        kwargs= {
-                            "biological_mother" : mother,
-                            "biological_father": father,
-                            "simulation": thisApp.simulation
-                        }
-                    )
-
 
     LOGGER.log( logging.INFO, '%d.%d (%d) Made %d new families', *UTILS.from_soldays( thisApp.solday ), thisApp.solday, num_relationships )
 
+##
+# Make up to `count` new families in one randomized greedy
+# matching pass over the pool of singles
+def make_batch( count ):
+
+    LOGGER.log( logging.INFO, '%d.%d (%d) Trying to make %d new families', *UTILS.from_soldays( thisApp.solday ), thisApp.solday, count )
+
+    pairs = MODELS.SINGLES.match(
+        count,
+        thisApp.solday - UTILS.years_to_sols(18),
+        UTILS.years_to_sols(thisApp.partner_max_age_difference),
+        MODELS.FAMILY_POLICY.check )
+
+    rows = [ pool_row( pair ) for pair in pairs ]
+
+    relationship_ids = [ RANDOM.id() for row in rows ]
+
+    for ( row, relationship_id ) in zip( rows, relationship_ids ):
+
+        MODELS.DOMAIN.partnership_started( relationship_id, row['userid1'], row['userid2'] )
+
+        LOGGER.log( logging.INFO, '%d.%d Creating family between %s %s and %s %s',
+            *UTILS.from_soldays( thisApp.solday ),
+            row['first_name1'], row['family_name1'], row['first_name2'], row['family_name2'] )
+
+        start_family( row, relationship_id )
+
+    LOGGER.log( logging.INFO, '%d.%d (%d) Made %d new families', *UTILS.from_soldays( thisApp.solday ), thisApp.solday, len( rows ) )
+
 ##
 # break up a family (while partners are alive)
 # clearing up a family where one member dies is handled
-# in the database layer (models/triggers.py)
+# by the domain events (models/domain.py)
 def breakup( ):
     pass
@@ -0,0 +1,148 @@
+#! /usr/bin/env python3
+
+## Copyright (c) 2019,2023 Richard Offer. All right reserved.
+#
+# see LICENSE.md for license details
+
+import logging
+
+import click
+
+from censere.config import thisApp
+
+import censere.db as DB
+
+import censere.models as MODELS
+import censere.models.functions as FUNC
+
+import censere.actions.families as FAMILIES
+
+LOGGER = logging.getLogger("c.cli.db")
+DEVLOG = logging.getLogger("d.devel")
+
+## Initialize the database
+# Creating it if it doesn't exist and then
+# creating the tables, opened the same way as the generator
+# so the plans are explained with the same pragmas and views
+def initialize_database( pragmas ):
+
+    DB.open_database( thisApp.database, pragmas=pragmas )
+
+    FUNC.register_all( DB.db )
+
+    DB.create_tables()
+
+
+##
+# The queries that are explained need a simulation and a solday
+# to bind against, take them from the simulation (the latest if not given)
+def select_simulation( simulation ):
+
+    query = MODELS.Simulation.select()
+
+    if simulation:
+        query = query.where( MODELS.Simulation.simulation_id == simulation )
+
+    s = query.order_by( MODELS.Simulation.begin_datetime.desc() ).first()
+
+    # defaults match the generator options
+    thisApp.partner_max_age_difference = 20
+    thisApp.common_ancestor = 5
+
+    if s is None:
+        thisApp.simulation = simulation
+        thisApp.solday = 0
+        return
+
+    thisApp.simulation = s.simulation_id
+    thisApp.solday = s.final_soldays or 0
+
+    for kv in ( s.args or "" ).split(" "):
+        ( k, _, v ) = kv.partition("=")
+        if k in ( "partner_max_age_difference", "common_ancestor" ):
+            try:
+                setattr( thisApp, k, int(v) )
+            except ValueError:
+                pass
+
+
+def explain( name, query ):
+
+    ( sql, params ) = query.sql()
+
+    click.echo( f"-- {name}" )
+
+    for row in DB.db.execute_sql( "EXPLAIN QUERY PLAN " + sql, params ).fetchall():
+        # ( id, parent, notused, detail )
+        click.echo( f"   {row[-1]}" )
+
+    click.echo( "" )
+
+
+@click.group("db")
+@click.pass_context
+def cli( ctx ):
+    """Database maintenance"""
+
+    pass
+
+
+@cli.command("optimize")
+@click.pass_context
+@click.option(
+    '--simulation',
+        default="",
+        help="Simulation to explain the queries against (default: latest)")
+@click.option(
+    '--drop',
+        default=False,
+        is_flag=True,
+        help="Drop the secondary indexes instead of creating them")
+@click.option(
+    '--analyze/--no-analyze',
+        default=True,
+        help="Update the query planner statistics")
+@click.option(
+    '--vacuum/--no-vacuum',
+        default=False,
+        help="Rebuild the database file to reclaim space")
+@click.option(
+    '--explain/--no-explain',
+        'explain_plans',
+        default=True,
+        help="Report the query plans of the hot queries")
+@click.option(
+    '--pragmas',
+        type=click.Choice(sorted(DB.PRAGMAS.keys()), case_sensitive=False),
+        default='default',
+        help="SQLite PRAGMA profile, as given to the generator")
+def optimize( ctx, simulation, drop, analyze, vacuum, explain_plans, pragmas ):
+    """Create (or drop) indexes and report query plans"""
+
+    initialize_database( pragmas )
+
+    if drop:
+        LOGGER.log( thisApp.NOTICE, 'Dropping indexes from %s', thisApp.database )
+        DB.drop_indexes()
+    else:
+        LOGGER.log( thisApp.NOTICE, 'Creating indexes (version %d) in %s', DB.INDEX_VERSION, thisApp.database )
+        DB.create_indexes()
+
+    if analyze:
+        LOGGER.log( thisApp.NOTICE, 'Analyzing %s', thisApp.database )
+        DB.db.execute_sql( "ANALYZE" )
+
+    if vacuum:
+        LOGGER.log( thisApp.NOTICE, 'Vacuuming %s', thisApp.database )
+        DB.db.execute_sql( "VACUUM" )
+
+    if explain_plans:
+
+        select_simulation( simulation )
+
+        explain( "families.make", FAMILIES.candidates_query() )
+
+        explain( "Summary", MODELS.Summary.query() )
+
+        for ( name, query ) in MODELS.Demographic.queries().items():
+            explain( f"Demographic.{name}", query )
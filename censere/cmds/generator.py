@@ -10,6 +10,7 @@ import sys
 import base64
 import datetime
 import logging
+import math
 import pathlib
 import pickle as ENC
 import uuid
@@ -28,9 +29,6 @@ import censere.db as DB
 import censere.events as EVENTS
 
 import censere.models as MODELS
-# Import the database triggers to handle automation inside the DB
-# Not called directly, but still needed 
-import censere.models.triggers as TRIGGERS #pylint: disable=unused-import
 import censere.models.functions as FUNC
 
 
@@ -79,9 +77,43 @@ Order of precidence (lowest first):
 * CLI arguments
 
 
+Storage
+=======
+
+  --storage=memory runs the whole simulation in memory, starting from a copy of
+  --database if it exists, and writes it back every --checkpoint-years sol-years
+  and at the end. If the generator dies the file holds the last checkpoint, which
+  can be resumed with --continue-simulation.
+
+  --pragmas=fast keeps the database on disk but uses WAL and synchronous=OFF, an
+  OS crash or power loss while running can corrupt the file.
+
+  --engine=memory keeps the colony in NumPy columns, the summaries are counted
+  from those rather than queried, and the settlers and relationships are only
+  written out as each block of --transaction-sols is committed. The tables are
+  the same either way, so raise --transaction-sols to get the most out of it.
+
 ...
 
 
+Family Policies
+===============
+
+  --family-policies is a comma separated list of the social policies that
+  all have to allow a new family, each one only checks the pairs the earlier
+  ones allowed so put the cheapest first.
+
+  relatives:
+    no blood relatives closer than --common-ancestor generations (the default)
+
+  heterosexual:
+    only couples of opposite sexes
+
+  module.Class:
+    a models.Policy subclass, called with a batch of models.Pairs and
+    returning a boolean NumPy mask of the allowed pairs
+
+
 RANDOM Values
 =============
 
@@ -119,12 +151,14 @@ Acceptable Values are:
 # creating the tables
 def initialize_database():
 
-    DB.db.init( thisApp.database ) 
+    DB.open_database( thisApp.database, storage=thisApp.storage, pragmas=thisApp.pragmas )
 
     FUNC.register_all( DB.db )
 
     DB.create_tables()
 
+    DB.create_indexes()
+
 
 def register_initial_landing():
 
@@ -139,45 +173,124 @@ def register_initial_landing():
         )
 
 
+##
+# These are read every sol, so come from the live census
+# rather than counting the settlers table
 def get_limit_count( limit="population" ):
 
     count = 0
-    try:
-        if limit == "sols":
-            count = thisApp.solday
 
-        if limit == "population":
+    if limit == "sols":
+        count = thisApp.solday
 
-            count = MODELS.Settler.select().where( 
-                ( MODELS.Settler.simulation_id == thisApp.simulation ) &
-                ( MODELS.Settler.current_location == MODELS.LocationEnum.Mars ) &
-                ( MODELS.Settler.death_solday == 0 )
-            ).count()
+    if limit == "population":
+        count = MODELS.CENSUS.locations[ MODELS.LocationEnum.Mars ]
 
-    except Exception as e:
-
-        LOGGER.error( e )
-    
     return count
 
+##
+# Settlers never leave Mars, so all the living singles are on Mars
 def get_singles_count( ):
 
-    count = 0
+    return MODELS.CENSUS.states[ 'single' ]
 
-    try:
-        count = MODELS.Settler.select().where(
-            ( MODELS.Settler.simulation_id == thisApp.simulation ) &
-            ( MODELS.Settler.current_location == MODELS.LocationEnum.Mars ) &
-            ( MODELS.Settler.death_solday == 0 ) &
-            ( MODELS.Settler.state == 'single' )
-        ).count()
+##
+# Sample the solday of the next successful pairing check after `solday`
+#
+# Each sol the pairing check succeeds with probability
+# `fraction_singles_pairing_per_day * singles`, and the number of singles
+# only changes when an event runs, so until then the number of sols to
+# the next success is geometrically distributed.
+# Returns None if no-one can pair.
+#
+# In `batch` matching a sol has pairings with probability 1 - exp(-λ)
+# where λ is the expected number of them, see get_pairings_count()
+def get_next_pairing_solday( solday ):
+
+    probability = float( thisApp.fraction_singles_pairing_per_day ) * get_singles_count()
+
+    if thisApp.matching == 'batch':
+        probability = -math.expm1( -probability )
+
+    if probability <= 0.0:
+        return None
+
+    if probability >= 1.0:
+        return solday + 1
+
+    return solday + RANDOM.geometric( probability )
+
+##
+# The number of partnerships to try to make today in `batch` matching.
+#
+# Poisson distributed with a mean of `fraction_singles_pairing_per_day * singles`,
+# the same as the chance of the single pairing check below saturation, but
+# without the limit of one family a sol.
+#
+# \param at_least_one - `event` mode has already decided today has pairings
+def get_pairings_count( singles, at_least_one=False ):
+
+    lam = float( thisApp.fraction_singles_pairing_per_day ) * singles
+
+    if lam <= 0.0:
+        return 0
 
-    except Exception as e:
+    count = RANDOM.poisson( lam )
 
-        LOGGER.error( e )
+    while at_least_one and count == 0:
+        count = RANDOM.poisson( lam )
 
     return count
 
+##
+# Start today's new families, either checking for one or
+# drawing how many to make in one batch
+def make_families( singles, at_least_one=False ):
+
+    if thisApp.matching == 'batch':
+
+        count = get_pairings_count( singles, at_least_one )
+
+        if count > 0:
+            ACTIONS.make_families_batch( count )
+
+    elif at_least_one or RANDOM.random() < float(thisApp.fraction_singles_pairing_per_day) * singles :
+
+        ACTIONS.make_families( )
+
+##
+# Return the next solday after `solday` that gets a summary entry
+# i.e. every 28 sols, restarting at the beginning of each solyear
+def get_next_summary_solday( solday ):
+
+    ( year, sol ) = divmod( solday, 668 )
+
+    sol = ( ( sol // 28 ) + 1 ) * 28
+
+    if sol >= 668:
+        return ( year + 1 ) * 668
+
+    return ( year * 668 ) + sol
+
+
+##
+# Record how far the simulation has got, so that it can be 
+# continued with --continue-simulation from the last committed
+# block of sols (or checkpoint)
+def save_progress():
+
+    (
+        MODELS.Simulation.update( 
+                { 
+                    MODELS.Simulation.final_soldays: thisApp.solday,
+                    MODELS.Simulation.random_state: base64.b64encode(ENC.dumps(RANDOM.get_state())),
+                } 
+            ).where( 
+                ( MODELS.Simulation.simulation_id == thisApp.simulation )
+            ).execute()
+    )
+
+
 def add_summary_entry():
 
     s = MODELS.Summary()
@@ -186,12 +299,18 @@ def add_summary_entry():
 
     s.save()
 
+    MODELS.VITALS.summarized( s )
+
     return { "solday" : s.solday, "earth_datetime" : s.earth_datetime, "population": s.population }
 
 
 def add_annual_demographics( ):
 
 
+    if thisApp.check_census:
+        MODELS.DOMAIN.flush( )
+        MODELS.VITALS.check( MODELS.Demographic.queries() )
+
     # demographics includes birth and death rates
     d = MODELS.Demographic()
 
@@ -199,41 +318,142 @@ def add_annual_demographics( ):
     
     d.save()
 
+    if thisApp.kinship_report:
+
+        # the dead are kept while they still have children to come
+        parents = set()
+
+        for kwargs in EVENTS.pending_callbacks( EVENTS.settler_born ):
+            parents.update( ( kwargs["biological_father"], kwargs["biological_mother"] ) )
+
+        MODELS.KINSHIP.expire( parents )
+
+        k = MODELS.KinshipReport()
+
+        k.initialize()
+
+        k.save()
+
 
     # This is population age and gender breakdown
     # useful for population pyramids
-    (males, females) = MODELS.get_population_histogram()
+    (males, females) = MODELS.get_population_histogram( MODELS.parse_population_bins( thisApp.population_bins ) )
 
-    for r in range( len(males[0]) ):
+    rows = []
 
-        p = MODELS.Population()
+    for ( sex, ( values, edges ) ) in ( ( 'm', males ), ( 'f', females ) ):
 
-        p.simulation_id = thisApp.simulation
+        for r in range( len( values ) ):
 
-        p.solday = thisApp.solday
-        p.earth_datetime = thisApp.earth_time
+            rows.append( {
+                "simulation_id": thisApp.simulation,
+                "solday": thisApp.solday,
+                "earth_datetime": thisApp.earth_time,
+                "bucket": "{}-{}".format( edges[r], edges[r+1] ),
+                "sol_years": edges[r],
+                "sex": sex,
+                "value": values[r],
+            } )
 
-        p.bucket = "{}-{}".format( males[1][r], males[1][r+1])
-        p.sol_years = males[1][r]
-        p.sex = 'm'
-        p.value = males[0][r]
+    MODELS.Population.insert_many( rows ).execute()
 
-        p.save()
+##
+# Simulate everything that happens on thisApp.solday and then
+# move thisApp.solday (and earth_time) on to the next sol to simulate
+#
+# \param next_pairing_solday - the sol the next pairing check succeeds on (`event` mode only)
+# \return the updated next_pairing_solday
+def simulate_sol( next_pairing_solday ):
 
-    for r in range( len( females[0]) ):
+    ( solyear, sol ) = UTILS.from_soldays( thisApp.solday )
 
-        p = MODELS.Population()
+    if thisApp.time_advance == 'event':
 
-        p.simulation_id = thisApp.simulation
+        # Run any callback scheduled for this solday
+        EVENTS.invoke_callbacks( )
 
-        p.solday = thisApp.solday
-        p.earth_datetime = thisApp.earth_time
-        p.bucket = "{}-{}".format( females[1][r], females[1][r+1])
-        p.sol_years = females[1][r]
-        p.sex = 'f'
-        p.value = females[0][r]
+        # Poulation building
+        if thisApp.solday == next_pairing_solday:
+            make_families( get_singles_count(), at_least_one=True )
+
+    else:
+
+        current_singles_count = get_singles_count()
+
+        # Invoke actions every day...
+
+        # Run any callback scheduled for this solday
+        EVENTS.invoke_callbacks( )
+
+        # Poulation building
+        make_families( current_singles_count )
+
+    # the consequences of today's events are written in one go,
+    # or left until the block is committed
+    if thisApp.engine == 'sql':
+        MODELS.DOMAIN.flush( )
+    # TODO need a model for relationship breakdown
+    # break_families()
+
+    # Need a model for multi-person accidents
+    #  work or family
+    #  occupation
+    #  infection/disease
+    # consider multi-person accidents, either work or families
+
+    # Model resources - both consumed and produced
+    # Model inflation
+
+
+    # give a ~monthly (every 28 sols) and end of year log message
+    if ( sol % 28 ) == 0 or sol == 668:
+        LOGGER.log( thisApp.NOTICE, '%d.%03d (%d) #Settlers %d', *UTILS.from_soldays( thisApp.solday ), thisApp.solday, get_limit_count("population") )
+
+        if thisApp.cache_details:
+            LOGGER.log( logging.INFO, '%d.%d Pedigree %s', *UTILS.from_soldays( thisApp.solday ), MODELS.PEDIGREE.stats() )
+            LOGGER.log( logging.INFO, '%d.%d Policy cache %s', *UTILS.from_soldays( thisApp.solday ), MODELS.POLICY_CACHE.stats() )
+
+            if thisApp.kinship_report:
+                LOGGER.log( logging.INFO, '%d.%d Kinship %s', *UTILS.from_soldays( thisApp.solday ), MODELS.KINSHIP.stats() )
+
+        # returned data not used
+        res = add_summary_entry( )
         
-        p.save()
+    if solyear > 1 and ( sol % 668 ) == 0:
+
+        add_annual_demographics( )
+
+    # all of today's new events are journalled in one go
+    EVENTS.flush_callbacks( )
+
+
+    next_solday = thisApp.solday + 1
+
+    if thisApp.time_advance == 'event':
+
+        # singles may have changed today, so re-sample the next pairing.
+        # The geometric distribution is memoryless so this doesn't bias it
+        next_pairing_solday = get_next_pairing_solday( thisApp.solday )
+
+        candidates = [ 
+            next_pairing_solday,
+            EVENTS.next_callback_solday(),
+            get_next_summary_solday( thisApp.solday )
+        ]
+
+        if thisApp.limit == "sols":
+            candidates.append( thisApp.limit_count )
+
+        next_solday = max( min( [ c for c in candidates if c is not None ] ), thisApp.solday + 1 )
+
+    # from wikipedia
+    # https://en.wikipedia.org/wiki/Timekeeping_on_Mars#Sols
+    thisApp.earth_time = thisApp.earth_time + ( next_solday - thisApp.solday ) * datetime.timedelta( seconds=88775, microseconds=244147) 
+
+    thisApp.solday = next_solday
+
+    return next_pairing_solday
+
 
 ## 
 # Main entry point for execution
@@ -284,6 +504,18 @@ def add_annual_demographics( ):
         type=int,
         default=5,
         help="Allow realtionships where common ancestor is older than GEN. GEN=1 => parent, GEN=2 => grandparent etc (CENSERE_GENERATOR_COMMON_ANCESTOR)")
+@click.option( '--family-policies',
+        metavar="POLICY,POLICY",
+        default='relatives',
+        help="Social policies that all have to allow a new family, see --hints (CENSERE_GENERATOR_FAMILY_POLICIES)")
+@click.option( '--kinship-report',
+        is_flag=True,
+        default=False,
+        help="Track kinship coefficients and record the inbreeding of new partnerships and births every sol-year in the kinship table (CENSERE_GENERATOR_KINSHIP_REPORT)")
+@click.option( '--population-bins',
+        metavar="SOLYEARS,SOLYEARS",
+        default="0,5,10,15,20,25,30,35,40,45,50",
+        help="Age bands, in sol-years, of the annual population pyramid in the populations table (CENSERE_GENERATOR_POPULATION_BINS)")
 @click.option( '--first-child-delay',
         metavar="RANDOM",
         default="randint:350,700",
@@ -367,12 +599,62 @@ def add_annual_demographics( ):
         default='randint:1,1',
         help="Number of ships for subsequent missions (CENSERE_GENERATOR_SHIPS_PER_MISSION)")
 #
+# performance options
+#
+@click.option( '--time-advance',
+        type=click.Choice(['sol', 'event'], case_sensitive=False),
+        default='sol',
+        help="Step the simulation one sol at a time, or jump straight to the next sol where something happens (CENSERE_GENERATOR_TIME_ADVANCE)")
+@click.option( '--pairing',
+        type=click.Choice(['pool', 'sql'], case_sensitive=False),
+        default='pool',
+        help="Find new partners from an in-memory pool of singles, or with a query (CENSERE_GENERATOR_PAIRING)")
+@click.option( '--matching',
+        type=click.Choice(['single', 'batch'], case_sensitive=False),
+        default='single',
+        help="Check for one new family a sol, or draw how many to make and pair them in one pass over the pool of singles (CENSERE_GENERATOR_MATCHING)")
+@click.option( '--relationship-storage',
+        type=click.Choice(['generational', 'direct'], case_sensitive=False),
+        default='generational',
+        help="Store a row for every ancestor of a settler, or only their parents. The relationships_expanded view shows the generational rows either way (CENSERE_GENERATOR_RELATIONSHIP_STORAGE)")
+@click.option( '--policy-cache-size',
+        metavar="ENTRIES",
+        type=click.IntRange(min=0),
+        default=65536,
+        help="Remember up to ENTRIES family policy decisions in memory, 0 to disable. Refusals are also kept in the database for --continue-simulation (CENSERE_GENERATOR_POLICY_CACHE_SIZE)")
+@click.option( '--transaction-sols',
+        metavar="SOLS",
+        type=click.IntRange(min=1),
+        default=1,
+        help="Commit the database every SOLS sols (CENSERE_GENERATOR_TRANSACTION_SOLS)")
+@click.option( '--storage',
+        type=click.Choice(['file', 'memory'], case_sensitive=False),
+        default='file',
+        help="Run against the database file, or in memory with checkpoints to the file (CENSERE_GENERATOR_STORAGE)")
+@click.option( '--engine',
+        type=click.Choice(['sql', 'memory'], case_sensitive=False),
+        default='sql',
+        help="Count the colony with queries, or hold it in NumPy columns and only write it out at each --transaction-sols commit (CENSERE_GENERATOR_ENGINE)")
+@click.option( '--checkpoint-years',
+        metavar="YEARS",
+        type=int,
+        default=1,
+        help="With --storage=memory, checkpoint to the database file every YEARS sol-years, 0 for only at exit (CENSERE_GENERATOR_CHECKPOINT_YEARS)")
+@click.option( '--pragmas',
+        type=click.Choice(sorted(DB.PRAGMAS.keys()), case_sensitive=False),
+        default='default',
+        help="SQLite PRAGMA profile, `fast` trades durability for speed (CENSERE_GENERATOR_PRAGMAS)")
+#
 # debug options
 #
 @click.option( '--cache-details',
         is_flag=True,
         default=False,
-        help="Log cache effectiveness as the simulation runs (CENSERE_GENERATOR_CACHE_DETAILS)")
+        help="Log cache and pedigree sizes as the simulation runs (CENSERE_GENERATOR_CACHE_DETAILS)")
+@click.option( '--check-census',
+        is_flag=True,
+        default=False,
+        help="Check the live population counts, resident settlers and --engine=memory colony against the database every sol, slow (CENSERE_GENERATOR_CHECK_CENSUS)")
 @click.option( '--hints',
         is_flag=True,
         default=False,
@@ -391,6 +673,9 @@ def cli( ctx,
         astronaut_gender_ratio,
         astronaut_life_expectancy,
         common_ancestor,
+        family_policies,
+        kinship_report,
+        population_bins,
         first_child_delay,
         fraction_singles_pairing_per_day,
         fraction_relationships_having_children,
@@ -411,7 +696,19 @@ def cli( ctx,
         settlers_per_ship,
         ships_per_mission,
 
-        cache_details
+        time_advance,
+        pairing,
+        matching,
+        relationship_storage,
+        policy_cache_size,
+        transaction_sols,
+        storage,
+        engine,
+        checkpoint_years,
+        pragmas,
+
+        cache_details,
+        check_census
         # hints is hidden
        ):
     """Generate simulation data"""
@@ -425,6 +722,9 @@ def cli( ctx,
     thisApp.astronaut_gender_ratio = astronaut_gender_ratio
     thisApp.astronaut_life_expectancy = astronaut_life_expectancy
     thisApp.common_ancestor = common_ancestor
+    thisApp.family_policies = family_policies
+    thisApp.kinship_report = kinship_report
+    thisApp.population_bins = population_bins
     thisApp.first_child_delay = first_child_delay
     thisApp.fraction_singles_pairing_per_day = fraction_singles_pairing_per_day
     thisApp.fraction_relationships_having_children = fraction_relationships_having_children
@@ -443,7 +743,18 @@ def cli( ctx,
     thisApp.initial_ships_per_mission = initial_ships_per_mission
     thisApp.settlers_per_ship = settlers_per_ship
     thisApp.ships_per_mission = ships_per_mission
+    thisApp.time_advance = time_advance
+    thisApp.pairing = pairing
+    thisApp.matching = matching
+    thisApp.relationship_storage = relationship_storage
+    thisApp.policy_cache_size = policy_cache_size
+    thisApp.transaction_sols = transaction_sols
+    thisApp.storage = storage
+    thisApp.engine = engine
+    thisApp.checkpoint_years = checkpoint_years
+    thisApp.pragmas = pragmas
     thisApp.cache_details = cache_details
+    thisApp.check_census = check_census
 
     ## add legacy aliases
     thisApp.settlers_per_initial_ship = thisApp.initial_settlers_per_ship
@@ -456,6 +767,16 @@ def cli( ctx,
             thisApp.astronaut_age_range,
             thisApp.astronaut_life_expectancy)
 
+    try:
+        MODELS.FAMILY_POLICY.select( thisApp.family_policies )
+    except ( ImportError, AttributeError, ValueError ) as e:
+        raise click.BadParameter( str(e), param_hint="--family-policies" )
+
+    try:
+        MODELS.parse_population_bins( thisApp.population_bins )
+    except ValueError as e:
+        raise click.BadParameter( str(e), param_hint="--population-bins" )
+
     logging.getLogger('peewee').setLevel(logging.INFO)
 
     if thisApp.debug_sql:
@@ -528,8 +849,21 @@ def cli( ctx,
     LOGGER.log( thisApp.NOTICE, '%d.%03d (%d) Simulation %s Updating %s', *UTILS.from_soldays( thisApp.solday ), thisApp.solday, thisApp.simulation, thisApp.database )
 
 
+    MODELS.CENSUS.load( )
+    MODELS.SINGLES.load( )
+    MODELS.PEDIGREE.load( )
+    MODELS.PARTNERSHIPS.load( )
+    MODELS.RESIDENTS.load( )
+    MODELS.POLICY_CACHE.load( thisApp.policy_cache_size )
+    MODELS.KINSHIP.load( thisApp.kinship_report )
+    MODELS.COLONY.load( thisApp.engine == 'memory' )
+    MODELS.VITALS.load( )
+
     if thisApp.continue_simulation == "":
         register_initial_landing()
+    else:
+        # pending events are held in memory, so rebuild them from the journal
+        EVENTS.load_callbacks()
 
     # all calculations are done in sols (integers from day of landing)
     # but convert to earth datetime to make elapsed time easier to comprehend
@@ -553,57 +887,76 @@ def cli( ctx,
     d.save()
 
 
-    while get_limit_count( thisApp.limit ) < thisApp.limit_count:
+    # In `event` mode the pairing check is not drawn every sol,
+    # instead we sample the sol it next succeeds on
+    next_pairing_solday = None
 
-        ( solyear, sol ) = UTILS.from_soldays( thisApp.solday )
+    if thisApp.time_advance == 'event':
+        next_pairing_solday = get_next_pairing_solday( thisApp.solday - 1 )
 
-        current_singles_count = get_singles_count()
+    checkpoint_sols = 668 * thisApp.checkpoint_years
 
-        # Invoke actions every day...
+    if checkpoint_sols > 0:
+        # the first multiple of checkpoint_sols we haven't already run
+        next_checkpoint_solday = max( -( -thisApp.solday // checkpoint_sols ) * checkpoint_sols, checkpoint_sols )
 
-        # Run any callback scheduled for this solday
-        EVENTS.invoke_callbacks( )
+    finished = get_limit_count( thisApp.limit ) >= thisApp.limit_count
 
-        # Poulation building
-        if RANDOM.random() < float(thisApp.fraction_singles_pairing_per_day) * current_singles_count :
-            ACTIONS.make_families( )
-        # TODO need a model for relationship breakdown
-        # break_families()
+    while not finished:
+
+        block_ends = thisApp.solday + thisApp.transaction_sols
+
+        # Everything a block of sols writes is committed together,
+        # if the generator dies the database rolls back to the last block
+        # and can be resumed from there with --continue-simulation
+        with DB.db.atomic():
+
+            changes = DB.db.connection().total_changes
+
+            while True:
+
+                next_pairing_solday = simulate_sol( next_pairing_solday )
 
-        # Need a model for multi-person accidents
-        #  work or family
-        #  occupation
-        #  infection/disease
-        # consider multi-person accidents, either work or families
+                if thisApp.check_census:
+                    MODELS.DOMAIN.flush( )
 
-        # Model resources - both consumed and produced
-        # Model inflation
+                    MODELS.CENSUS.check( )
+                    MODELS.RESIDENTS.check( )
+                    MODELS.COLONY.check( )
 
+                finished = get_limit_count( thisApp.limit ) >= thisApp.limit_count
 
-        # give a ~monthly (every 28 sols) and end of year log message
-        if ( sol % 28 ) == 0 or sol == 668:
-            LOGGER.log( thisApp.NOTICE, '%d.%03d (%d) #Settlers %d', *UTILS.from_soldays( thisApp.solday ), thisApp.solday, get_limit_count("population") )
+                if finished or thisApp.solday >= block_ends:
+                    break
 
-            if thisApp.cache_details:
-                LOGGER.log( logging.INFO, '%d.%d Family Policy %s', *UTILS.from_soldays( thisApp.solday ), MODELS.functions.family_policy.cache_info() )
+            MODELS.POLICY_CACHE.flush( )
+            MODELS.DOMAIN.flush( )
 
-            # returned data not used
-            res = add_summary_entry( )
-            
-        if solyear > 1 and ( sol % 668 ) == 0:
+            # Most sols write nothing, and continuing from the last save
+            # replays them identically, so there is nothing to commit
+            if DB.db.connection().total_changes != changes:
+                save_progress( )
 
-            add_annual_demographics( )
+        # the backup has to be taken outside of a transaction
+        if thisApp.storage == 'memory' and checkpoint_sols > 0 and thisApp.solday > next_checkpoint_solday:
 
-        thisApp.solday += 1
-        # from wikipedia
-        # https://en.wikipedia.org/wiki/Timekeeping_on_Mars#Sols
-        thisApp.earth_time = thisApp.earth_time + datetime.timedelta( seconds=88775, microseconds=244147) 
+            DB.checkpoint( )
 
-    res = add_summary_entry()
+            LOGGER.log( thisApp.NOTICE, '%d.%03d (%d) Checkpointed to %s', *UTILS.from_soldays( thisApp.solday ), thisApp.solday, thisApp.database )
 
-    add_annual_demographics( )
+            next_checkpoint_solday = -( -thisApp.solday // checkpoint_sols ) * checkpoint_sols
+
+    with DB.db.atomic():
+
+        res = add_summary_entry()
+
+        add_annual_demographics( )
+
+        EVENTS.flush_callbacks( )
+
+        MODELS.POLICY_CACHE.flush( )
+        MODELS.DOMAIN.flush( )
 
-    ( 
         MODELS.Simulation.update( 
                 { 
                     MODELS.Simulation.end_datetime: datetime.datetime.now(),
@@ -615,11 +968,13 @@ def cli( ctx,
             ).where( 
                 ( MODELS.Simulation.simulation_id == thisApp.simulation )
             ).execute()
-    )
+
+    DB.checkpoint( )
 
     LOGGER.log( thisApp.NOTICE, '%d.%03d (%d) Simulation %s Completed.', *UTILS.from_soldays( thisApp.solday ), thisApp.solday, thisApp.simulation  )
     LOGGER.log( thisApp.NOTICE, '%d.%03d (%d) Simulation %s Seed = %d', *UTILS.from_soldays( thisApp.solday ), thisApp.solday, thisApp.simulation, thisApp.random_seed )
     LOGGER.log( thisApp.NOTICE, '%d.%03d (%d) Simulation %s Final %s %d >= %d', *UTILS.from_soldays( thisApp.solday ), thisApp.solday, thisApp.simulation, thisApp.limit, get_limit_count( thisApp.limit ), thisApp.limit_count )
     LOGGER.log( thisApp.NOTICE, '%d.%03d (%d) Simulation %s Updated %s', *UTILS.from_soldays( thisApp.solday ), thisApp.solday, thisApp.simulation, thisApp.database )
-    LOGGER.log( logging.INFO, '%d.%d Family Policy %s', *UTILS.from_soldays( thisApp.solday ), MODELS.functions.family_policy.cache_info() )
+    LOGGER.log( logging.INFO, '%d.%d Pedigree %s', *UTILS.from_soldays( thisApp.solday ), MODELS.PEDIGREE.stats() )
+    LOGGER.log( logging.INFO, '%d.%d Policy cache %s', *UTILS.from_soldays( thisApp.solday ), MODELS.POLICY_CACHE.stats() )
 
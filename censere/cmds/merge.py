@@ -26,6 +26,27 @@ def initialize_database():
     DB.create_tables()
 
 
+##
+# `column` of `table` in the attached source database, or the value
+# it has in older rows if the source was written before it existed
+def source_column( cursor, table, column ):
+
+    existing = set( row[1] for row in cursor.execute( f"PRAGMA source.table_info({table})" ).fetchall() )
+
+    if column in existing:
+        return column
+
+    return "{} AS {}".format( DB.COLUMNS[table][column][1], column )
+
+
+##
+# \return True if the attached source database has `table`,
+# older databases don't have the tables added since
+def source_has_table( cursor, table ):
+
+    return cursor.execute( "SELECT 1 FROM source.sqlite_master WHERE type = 'table' AND name = ?", ( table, ) ).fetchone() is not None
+
+
 @click.command("merge-db")
 @click.pass_context
 @click.argument('args',
@@ -48,7 +69,7 @@ def cli( ctx, args ):
 
         cursor = cnx.cursor()
 
-        cursor.execute("ATTACH DATABASE ? as source",( db, ))
+        cursor.execute("ATTACH DATABASE ? as source",( db.name, ))
 
         cursor.execute( "BEGIN TRANSACTION")
 
@@ -82,23 +103,27 @@ FROM source.demographics""")
         cursor.execute( "COMMIT")
         cursor.execute( "BEGIN TRANSACTION")
 
-        cursor.execute( """
+        cursor.execute( f"""
 INSERT INTO 
     main.events(
         simulation_id,
         registered,
         "when",
         callback_func,
+        code,
         idx,
-        args
+        args,
+        cancelled
     ) 
 SELECT 
         simulation_id,
         registered,
         "when",
         callback_func,
+        {source_column( cursor, "events", "code" )},
         idx,
-        args
+        args,
+        {source_column( cursor, "events", "cancelled" )}
 FROM source.events""")
 
         cursor.execute( "COMMIT")
@@ -271,6 +296,63 @@ FROM source.summary""")
 
         cursor.execute( "COMMIT")
 
+        if source_has_table( cursor, "kinship" ):
+
+            cursor.execute( "BEGIN TRANSACTION")
+
+            cursor.execute( """
+INSERT INTO 
+    main.kinship(
+        simulation_id,
+        solday,
+        earth_datetime,
+        num_partnerships,
+        avg_partnership_kinship,
+        max_partnership_kinship,
+        num_births,
+        avg_inbreeding,
+        max_inbreeding,
+        matrix_entries
+    ) 
+SELECT 
+        simulation_id,
+        solday,
+        earth_datetime,
+        num_partnerships,
+        avg_partnership_kinship,
+        max_partnership_kinship,
+        num_births,
+        avg_inbreeding,
+        max_inbreeding,
+        matrix_entries
+FROM source.kinship""")
+
+            cursor.execute( "COMMIT")
+
+        # the refusals are read back by --continue-simulation
+        if source_has_table( cursor, "policy_cache" ):
+
+            cursor.execute( "BEGIN TRANSACTION")
+
+            cursor.execute( """
+INSERT INTO 
+    main.policy_cache(
+        simulation_id,
+        common_ancestor,
+        first,
+        second,
+        solday
+    ) 
+SELECT 
+        simulation_id,
+        common_ancestor,
+        first,
+        second,
+        solday
+FROM source.policy_cache""")
+
+            cursor.execute( "COMMIT")
+
         cursor.execute("DETACH DATABASE source")
 
 
@@ -26,6 +26,9 @@ class thisApp(object):
     astronaut_gender_ratio = None 
     astronaut_life_expectancy = None
     common_ancestor = None
+    family_policies = None
+    kinship_report = None
+    population_bins = None
     first_child_delay = None
     fraction_singles_pairing_per_day = None
     fraction_relationships_having_children = None
@@ -45,6 +48,17 @@ class thisApp(object):
     settlers_per_ship = None
     ships_per_mission = None
     cache_details = None
+    check_census = None
+    time_advance = None
+    pairing = None
+    matching = None
+    relationship_storage = None
+    policy_cache_size = None
+    transaction_sols = None
+    storage = None
+    engine = None
+    checkpoint_years = None
+    pragmas = None
 
     # runtime
     simulation = ""
@@ -2,10 +2,76 @@
 #
 # see LICENSE.md for license details
 
+import pathlib
+import sqlite3
+
 import peewee
 
 db = peewee.SqliteDatabase( None )
 
+##
+# Named PRAGMA profiles, selected with `--pragmas`
+PRAGMAS = {
+    # sqlite's own defaults
+    "default": {},
+
+    # For runs that must stay on disk. Trades durability for speed,
+    # a crash (of the OS, not just the generator) can lose recent sols
+    "fast": {
+        "journal_mode": "wal",
+        "synchronous": 0,
+        # negative is in KiB, i.e. 64MiB
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "temp_store": "memory",
+    },
+}
+
+# where checkpoint() copies an in-memory database to
+_checkpoint_file = None
+
+##
+# Open the database
+#
+# With storage="memory" the simulation runs against `:memory:`, 
+# seeded from `database` if it already exists, and checkpoint()
+# copies it back to `database`.
+def open_database( database, storage="file", pragmas="default" ):
+
+    global _checkpoint_file
+
+    if storage == "memory":
+
+        _checkpoint_file = database
+
+        db.init( ":memory:", pragmas=PRAGMAS[pragmas] )
+
+        # keep any earlier simulations (or the one being continued)
+        if pathlib.Path( database ).exists():
+
+            source = sqlite3.connect( database )
+            source.backup( db.connection() )
+            source.close()
+
+    else:
+
+        _checkpoint_file = None
+
+        db.init( database, pragmas=PRAGMAS[pragmas] )
+
+
+##
+# Copy an in-memory database to its file using the sqlite3 backup API.
+# Does nothing if the database is already on disk
+def checkpoint():
+
+    if _checkpoint_file is None:
+        return
+
+    target = sqlite3.connect( _checkpoint_file )
+    db.connection().backup( target )
+    target.close()
+
 import censere.models
 
 
@@ -16,8 +82,141 @@ def create_tables():
 
     censere.models.Demographic.create_table()
     censere.models.Event.create_table()
+    censere.models.KinshipReport.create_table()
     censere.models.Relationship.create_table()
+    censere.models.PolicyDecision.create_table()
     censere.models.Population.create_table()
     censere.models.Settler.create_table()
     censere.models.Simulation.create_table()
     censere.models.Summary.create_table()
+
+    upgrade_tables()
+
+    create_views()
+
+
+##
+# Columns added to existing tables, as
+# table -> { column: ( definition, value for older rows ) }.
+# create_tables() adds any that are missing, so databases written
+# before the column existed can still be continued or merged
+COLUMNS = {
+    "events": {
+        "code": ( "INTEGER NOT NULL DEFAULT 0", "0" ),
+        "cancelled": ( "INTEGER", "NULL" ),
+    },
+}
+
+##
+# \return the names of the columns of `table`
+def table_columns( table ):
+
+    return set( row[1] for row in db.execute_sql( f"PRAGMA table_info({table})" ).fetchall() )
+
+
+def upgrade_tables():
+
+    for ( table, columns ) in COLUMNS.items():
+
+        existing = table_columns( table )
+
+        for ( name, ( definition, _ ) ) in columns.items():
+
+            if name not in existing:
+                db.execute_sql( f"ALTER TABLE {table} ADD COLUMN {name} {definition}" )
+
+
+##
+# `relationships` as it looks with --relationship-storage=generational,
+# whichever way it was stored. The grandparent etc. rows are derived
+# from the direct parent links with a recursive CTE, so this works
+# for databases written in either mode. It has the same columns as
+# `relationships`, the derived rows have no id or relationship_id.
+RELATIONSHIPS_VIEW = """
+CREATE VIEW relationships_expanded AS
+WITH RECURSIVE ancestors( id, simulation_id, relationship_id, first, second, relationship, begin_solday ) AS (
+    SELECT id, simulation_id, relationship_id, first, second, relationship, begin_solday
+        FROM relationships
+        WHERE relationship = 1
+    UNION
+    SELECT NULL, a.simulation_id, NULL, a.first, r.second, a.relationship + 1, a.begin_solday
+        FROM ancestors AS a
+        JOIN relationships AS r ON ( r.first = a.second AND r.relationship = 1 )
+)
+SELECT id, simulation_id, relationship_id, first, second, relationship, begin_solday, 0 AS end_solday
+    FROM ancestors
+UNION ALL
+SELECT id, simulation_id, relationship_id, first, second, relationship, begin_solday, end_solday
+    FROM relationships
+    WHERE relationship = 0
+"""
+
+##
+# (Re)create the views, so databases keep up with changes to them
+def create_views():
+
+    db.execute_sql( "DROP VIEW IF EXISTS relationships_expanded" )
+
+    db.execute_sql( RELATIONSHIPS_VIEW )
+
+
+##
+# Secondary indexes for the hot queries, these are versioned
+# so that changing the set (bump INDEX_VERSION) lets
+# create_indexes() replace the old ones in an existing database.
+# Every name is prefixed with `censere_` so we never touch
+# the indexes peewee creates from the models.
+INDEX_VERSION = 3
+
+INDEXES = {
+    # Demographic death rate
+    # there is deliberately no (simulation_id, birth_solday) index, given one
+    # the planner sorts every candidate pair in families.make() instead of
+    # walking settler_id in order and stopping at the first compatible pair
+    "censere_settlers_death": 
+        "ON settlers( simulation_id, death_solday )",
+
+    # app_family_policy() relatives lookup
+    "censere_relationships_first": 
+        "ON relationships( first, relationship )",
+
+    # Demographic partnerships started/ended
+    "censere_relationships_begin": 
+        "ON relationships( simulation_id, relationship, begin_solday )",
+    "censere_relationships_end": 
+        "ON relationships( simulation_id, relationship, end_solday )",
+
+    "censere_events_when": 
+        "ON events( simulation_id, \"when\" )",
+
+    "censere_summary_solday": 
+        "ON summary( simulation_id, solday )",
+}
+
+##
+# Drop every index that we created
+def drop_indexes():
+
+    for ( name, ) in db.execute_sql( "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'censere\\_%' ESCAPE '\\'" ).fetchall():
+
+        db.execute_sql( f"DROP INDEX IF EXISTS {name}" )
+
+    db.execute_sql( "PRAGMA user_version = 0" )
+
+
+##
+# Create (or upgrade) the secondary indexes.
+# Safe to call on every start, the indexes are only
+# rebuilt when INDEX_VERSION changes
+def create_indexes():
+
+    ( version, ) = db.execute_sql( "PRAGMA user_version" ).fetchone()
+
+    if version != INDEX_VERSION:
+        drop_indexes()
+
+    for ( name, definition ) in INDEXES.items():
+
+        db.execute_sql( f"CREATE INDEX IF NOT EXISTS {name} {definition}" )
+
+    db.execute_sql( f"PRAGMA user_version = {INDEX_VERSION}" )
@@ -1,6 +1,13 @@
 #pylint: disable=unused-wildcard-import,unused-import
 
 from .store import register_callback as register_callback
+from .store import register_handler as register_handler
+from .store import cancel_callback as cancel_callback
+from .store import cancel_callbacks as cancel_callbacks
 from .store import invoke_callbacks as invoke_callbacks
+from .store import flush_callbacks as flush_callbacks
+from .store import load_callbacks as load_callbacks
+from .store import next_callback_solday as next_callback_solday
+from .store import pending_callbacks as pending_callbacks
 
 from .callbacks import *
@@ -24,6 +24,8 @@ import censere.utils.random as RANDOM
 import censere.events as EVENTS
 
 from .store import register_callback as register_callback
+from .store import register_handler as register_handler
+from .store import cancel_callbacks as cancel_callbacks
 
 LOGGER = logging.getLogger("c.e.callbacks")
 DEVLOG = logging.getLogger("d.devel")
@@ -45,14 +47,40 @@ def settler_dies(**kwargs):
         LOGGER.error( "settler_dies event called with no person identifier")
         return
 
-    LOGGER.log( thisApp.NOTICE, "%d.%03d Settler %s (%s) dies ", *UTILS.from_soldays( thisApp.solday ), name, id )
+    # the settler comes from the resident identity map rather
+    # than being selected and saved, so one death is a batch of one
+    settler_dies_batch( [ { "id": id, "name": name } ] )
 
-    # Call the instance method to trigger callback handling.
-    for c in MODELS.Settler().select().filter( ( MODELS.Settler.settler_id == id ) & ( MODELS.Settler.simulation_id == thisApp.simulation ) ):
+##
+# Several people die on the same day.
+#
+# Same result as calling settler_dies() for each event in turn,
+# see Domain.settlers_died() for what a death changes
+#
+def settler_dies_batch( events ):
+
+    ids = []
+
+    for kwargs in events:
+
+        if kwargs.get( "id" ) == None:
+            LOGGER.error( "settler_dies event called with no person identifier")
+            continue
+
+        LOGGER.log( thisApp.NOTICE, "%d.%03d Settler %s (%s) dies ", *UTILS.from_soldays( thisApp.solday ), kwargs.get( "name" ), kwargs["id"] )
 
-        c.death_solday = thisApp.solday
+        ids.append( kwargs["id"] )
 
-        c.save()
+    ( dying, ended ) = MODELS.DOMAIN.settlers_died( ids )
+
+    # and the relationships are no longer going to end naturally
+    for relationship_id in ended:
+
+        cancel_callbacks( relationship_id, end_relationship )
+
+    for i in dying:
+
+        cancel_callbacks( i, settler_born )
 
 ## A person should be born - 
 # the new person object is created only if mother is still alive
@@ -76,8 +104,8 @@ def settler_born(**kwargs):
     mother = None
 
     try:
-        father = MODELS.Settler.get( MODELS.Settler.settler_id == str(biological_father) ) 
-        mother = MODELS.Settler.get( MODELS.Settler.settler_id == str(biological_mother) ) 
+        father = MODELS.RESIDENTS.lookup( str(biological_father) )
+        mother = MODELS.RESIDENTS.lookup( str(biological_mother) )
 
     except Exception as e:
 
@@ -89,8 +117,7 @@ def settler_born(**kwargs):
         LOGGER.error( '%d.%03d Mother %s died while pregnant.', *UTILS.from_soldays( thisApp.solday ), str(biological_mother) )
         return
 
-    mother.pregnant = False
-    mother.save()
+    MODELS.RESIDENTS.set_pregnant( mother.settler_id, False )
 
     m = MODELS.Martian()
 
@@ -102,32 +129,11 @@ def settler_born(**kwargs):
     m.family_name = father.family_name
 
 
-    saved = m.save()
+    MODELS.DOMAIN.settler_added( m )
 
     # create the parent <-> child relationship
-    r1 = MODELS.Relationship()
-
-    r1.simulation_id = thisApp.simulation
-
-    r1.relationship_id= RANDOM.id()
-    r1.first=m.settler_id
-    r1.second=mother.settler_id
-    r1.relationship=MODELS.RelationshipEnum.parent
-    r1.begin_solday=thisApp.solday
-
-    r1.save()
-
-    r2 = MODELS.Relationship()
-
-    r2.simulation_id = thisApp.simulation
-
-    r2.relationship_id= RANDOM.id()
-    r2.first=m.settler_id
-    r2.second=father.settler_id
-    r2.relationship=MODELS.RelationshipEnum.parent
-    r2.begin_solday=thisApp.solday
-
-    r2.save()
+    MODELS.DOMAIN.parent_linked( m.settler_id, mother.settler_id )
+    MODELS.DOMAIN.parent_linked( m.settler_id, father.settler_id )
 
     LOGGER.log( thisApp.NOTICE, '%d.%03d Martian %s %s (%s) born', *UTILS.from_soldays( thisApp.solday ), m.first_name, m.family_name, m.settler_id )
 
@@ -143,18 +149,7 @@ def settler_born(**kwargs):
     # Are parents still together ?
     # if so then handle a possible sibling
 
-    parents_relationships = MODELS.Relationship.get(
-            (
-                ( MODELS.Relationship.first == str(biological_father) ) &
-                ( MODELS.Relationship.second == str(biological_mother) )
-            ) |
-            (
-                ( MODELS.Relationship.first == str(biological_mother) ) &
-                ( MODELS.Relationship.second == str(biological_father) )
-            )
-    )
-
-    if parents_relationships.end_solday == 0:
+    if MODELS.PARTNERSHIPS.find( biological_father, biological_mother ) is not None:
 
         mothers_age = UTILS.sols_to_age(thisApp.solday - mother.birth_solday)
 
@@ -227,7 +222,7 @@ def mission_lands(**kwargs):
 
             continue
 
-        saved = a.save()
+        MODELS.DOMAIN.settler_added( a )
 
         LOGGER.info( '%d.%03d Astronaut %s %s (%s) landed', *UTILS.from_soldays( thisApp.solday ), a.first_name, a.family_name, a.settler_id )
 
@@ -277,13 +272,35 @@ def mission_lands(**kwargs):
 # 
 def end_relationship(**kwargs):
 
-    id = kwargs['relationship_id'] 
+    end_relationship_batch( [ kwargs ] )
 
-    LOGGER.info("%d.%03d Relationship %s ended", *UTILS.from_soldays( thisApp.solday ), id )
+##
+# Break several relationships on the same day
+#
+# Same result as calling end_relationship() for each event,
+# the partners are single again
+#
+def end_relationship_batch( events ):
 
+    ids = [ kwargs['relationship_id'] for kwargs in events ]
 
-    rel = MODELS.Relationship.get( ( MODELS.Relationship.relationship_id == id ) & ( MODELS.Relationship.simulation_id == thisApp.simulation )  )
+    ended = set( MODELS.DOMAIN.partnerships_ended( ids ) )
 
-    rel.end_solday = thisApp.solday
+    for id in ids:
+
+        if id in ended:
+            LOGGER.info("%d.%03d Relationship %s ended", *UTILS.from_soldays( thisApp.solday ), id )
+        else:
+            LOGGER.error( '%d.%03d Failed to find relationship %s', *UTILS.from_soldays( thisApp.solday ), id )
 
-    rel.save()
+
+##
+# Handler codes are stored in the `events` table, so never
+# re-use or renumber them - only add new ones.
+#
+# A settler's pending births are keyed on the mother, and the end of a
+# relationship on its id, so they can be cancelled when someone dies
+register_handler( 1, settler_dies, ( ( "id", str ), ( "name", str ), ( "simulation", str ) ), batch_func=settler_dies_batch )
+register_handler( 2, settler_born, ( ( "biological_mother", str ), ( "biological_father", str ), ( "simulation", str ) ), key="biological_mother" )
+register_handler( 3, mission_lands, ( ( "settlers", int ), ( "simulation", str ) ) )
+register_handler( 4, end_relationship, ( ( "relationship_id", str ), ( "simulation", str ) ), batch_func=end_relationship_batch, key="relationship_id" )
@@ -1,7 +1,13 @@
 
+import functools
+import heapq
 import importlib
+import itertools
 import logging
 import json
+import operator
+
+import peewee
 
 from censere.config import thisApp
 
@@ -12,81 +18,537 @@ import censere.models as MODELS
 LOGGER = logging.getLogger("c.e.store")
 DEVLOG = logging.getLogger("d.devel")
 
+##
+# Event handlers are registered once (see the end of callbacks.py) with a
+# small integer code. The code is stored in the `events` journal so the
+# handler can be found again without importing it by name, and the
+# arguments are stored in a compact form using the handler's `fields`
+#
+# Code 0 is reserved for functions that have not been registered,
+# these are journalled by name with JSON arguments as before.
+class Handler():
+
+    # unit separator - not expected in names or identifiers
+    SEPARATOR = '\x1f'
+
+    def __init__( self, code, callback_func, fields=None, batch_func=None, key=None ):
+
+        self.code = code
+        self.callback_func = callback_func
+        self.name = "{}.{}".format( callback_func.__module__, callback_func.__name__ )
+
+        # sequence of ( keyword, type ) pairs, in the order they are journalled
+        self.fields = fields
+
+        # optional function that handles a list of events (as kwargs) in one go
+        self.batch_func = batch_func
+
+        # optional keyword whose value the events are indexed by for cancel_callbacks()
+        self.key = key
+
+    def __repr__(self):
+        return "{} ({})".format( self.name, self.code )
+
+    ## Return the compact representation of kwargs, or None if
+    # kwargs contain anything the fields don't describe
+    def encode( self, kwargs ):
+
+        if self.code == 0 or kwargs == None:
+            return None
+
+        if len( set( kwargs.keys() ) - set( f[0] for f in self.fields ) ):
+            return None
+
+        values = []
+
+        for ( name, field_type ) in self.fields:
+
+            value = kwargs.get( name )
+
+            if value == None:
+                values.append( "" )
+                continue
+
+            if type( value ) != field_type:
+                return None
+
+            value = str( value )
+
+            if value == "" or self.SEPARATOR in value:
+                return None
+
+            values.append( value )
+
+        return self.SEPARATOR.join( values )
+
+    def decode( self, args ):
+
+        kwargs = {}
+
+        for ( ( name, field_type ), value ) in zip( self.fields, args.split( self.SEPARATOR ) ):
+
+            if value != "":
+                kwargs[name] = field_type( value )
+
+        return kwargs
+
+## code -> Handler
+HANDLERS = {}
+
+## fully qualified function name -> Handler
+_handlers_by_name = {}
+
+##
+# \param code - unique small integer (> 0) stored in the journal
+# \param callback_func - the function to invoke
+# \param fields - sequence of ( keyword, type ) that the function is called with
+# \param batch_func - optional, called with the list of kwargs of consecutive
+#                     events for this handler instead of calling `callback_func`
+#                     for each one. It must have the same visible effect.
+# \param key - optional keyword, pending events can be cancelled by its value
+#              using cancel_callbacks()
+def register_handler( code, callback_func, fields, batch_func=None, key=None ):
+
+    if code in HANDLERS:
+        raise ValueError( "Event handler code {} is already used by {}".format( code, HANDLERS[code] ) )
+
+    h = Handler( code, callback_func, fields, batch_func, key )
+
+    HANDLERS[code] = h
+    _handlers_by_name[h.name] = h
+
+    return h
+
+##
+# Return the handler for a function (or its fully qualified name)
+# unregistered functions get a code 0 handler.
+def _get_handler( callback_func ):
+
+    if isinstance( callback_func, str ):
+        name = callback_func
+    else:
+        name = "{}.{}".format( callback_func.__module__, callback_func.__name__ )
+
+    if name not in _handlers_by_name:
+
+        if isinstance( callback_func, str ):
+
+            mod_name, func_name = callback_func.rsplit('.',1)
+
+            callback_func = getattr( importlib.import_module(mod_name), func_name )
+
+        _handlers_by_name[name] = Handler( 0, callback_func )
+
+    return _handlers_by_name[name]
+
+##
+# A scheduled event.
+# `register_callback()` returns this as a handle for `cancel_callback()`
+class Callback():
+
+    __slots__ = ( "when", "handler", "idx", "kwargs", "registered", "pending", "cancelled", "journalled" )
+
+    def __init__( self, when, handler, idx, kwargs, registered ):
+
+        self.when = when
+        self.handler = handler
+        self.idx = idx
+        self.kwargs = kwargs
+        self.registered = registered
+
+        # still in the queue, waiting to run
+        self.pending = True
+
+        # solday the event was cancelled on
+        self.cancelled = None
+
+        # has the event been written to the `events` table yet
+        self.journalled = False
+
+    def __repr__(self):
+        return "{}() at {} ({})".format( self.handler.name, self.when, self.idx )
+
+    def key( self ):
+
+        if self.handler.key:
+            return self.kwargs.get( self.handler.key )
+
+        return None
+
+##
+# Pending events are held in memory as a heap of (when, sequence, Callback)
+# the sequence number keeps events that land on the same solday in the
+# order they were registered (which is the order the `events` table
+# returned them in).
+#
+# The `events` table is now only a journal, it is written as events are
+# registered but only read back by `load_callbacks()` when continuing
+# a simulation.
+#
+# Cancelled events are left in the heap as tombstones and thrown
+# away when they reach the top.
+_queue = []
+
+_sequence = itertools.count()
+
+## `idx` for the next event on { when : { callback_func : idx } }
+# so multiple events on the same day can be told apart
+_counters = {}
+
+## pending events by the value of their handler's key { key : [ Callback ] }
+_keyed = {}
+
+## events waiting to be written by flush_callbacks()
+_journal = []
+
+## journalled events that have since been cancelled
+_tombstones = []
+
+
+def _push( callback ):
+
+    heapq.heappush( _queue, ( callback.when, next( _sequence ), callback ) )
+
+    key = callback.key()
+
+    if key != None:
+        _keyed.setdefault( key, [] ).append( callback )
+
+def _pop( ):
+
+    ( when, seq, callback ) = heapq.heappop( _queue )
+
+    _unkey( callback )
+
+    callback.pending = False
+
+    return callback
+
+def _unkey( callback ):
+
+    key = callback.key()
+
+    if key == None or key not in _keyed:
+        return
+
+    pending = _keyed[key]
+
+    if callback in pending:
+        pending.remove( callback )
+
+    if len( pending ) == 0:
+        del _keyed[key]
+
 ##
 # \param when - absolute solday to execute the function.
 # \param callback_func - fully qualified function
+#
+# Returns a handle that can be passed to cancel_callback()
 def register_callback( when=0, name="", callback_func=None, kwargs=None ):
 
     if when == 0 or callback_func == None:
 
         logging.error("Missing required arguments in call to register_callback()")
 
-        return
+        return None
 
+    # the journal stores `when` as an integer, make sure the queue agrees with it
+    when = int( when )
 
     LOGGER.log( thisApp.DETAILS, "%d.%03d Registering callback %s.%s() to be run at %d (%d.%d)", *UTILS.from_soldays( thisApp.solday ), callback_func.__module__, callback_func.__name__, when, *UTILS.from_soldays( when ) )
     LOGGER.debug( kwargs )
 
     try:
-        idx = MODELS.Event.select().where(
-            ( MODELS.Event.simulation_id == thisApp.simulation ) &
-            ( MODELS.Event.when == when ) &
-            ( MODELS.Event.callback_func == "{}.{}".format( callback_func.__module__, callback_func.__name__ ) )
-        ).count()
-
-        e = MODELS.Event()
-
-        e.simulation_id = thisApp.simulation
-        e.registered = thisApp.solday
-        e.when = when
-        e.idx = idx
-        # This allows us to pass a real function into the ergister function (rather then a string)
-        # but store the full name of the function for later execution
-        e.callback_func = "{}.{}".format( callback_func.__module__, callback_func.__name__ )
-        e.args =  json.dumps( kwargs )
-
-        e.save()
+        handler = _get_handler( callback_func )
+
+        counters = _counters.setdefault( when, {} )
+
+        idx = counters.get( handler.name, 0 )
+
+        counters[handler.name] = idx + 1
+
+        callback = Callback( when, handler, idx, dict( kwargs or {} ), thisApp.solday )
+
+        _push( callback )
+
+        _journal.append( callback )
+
+        return callback
+
     except Exception as e:
         LOGGER.log( logging.FATAL, "%d.%03d Failed to register callback %s() to be run at %d (%d.%d)", *UTILS.from_soldays( thisApp.solday ), callback_func, when, *UTILS.from_soldays( when ) )
 
+    return None
 
-def invoke_callbacks( ):
+##
+# Stop a pending event from running, the journal keeps a
+# record of it (with the solday it was cancelled on)
+#
+# Returns True if the event was still pending
+def cancel_callback( callback ):
 
-    LOGGER.info( '%d.%03d Processing scheduled events', *UTILS.from_soldays( thisApp.solday ) )
+    if callback == None or callback.pending == False or callback.cancelled != None:
+        return False
+
+    callback.cancelled = thisApp.solday
+
+    _unkey( callback )
+
+    if callback.journalled:
+        _tombstones.append( callback )
+
+    LOGGER.log( thisApp.DETAILS, "%d.%03d Cancelled callback %s", *UTILS.from_soldays( thisApp.solday ), callback )
+
+    return True
+
+##
+# Cancel all pending events whose handler key has the value `key`,
+# optionally only those for `callback_func`.
+#
+# Returns the number of events cancelled
+def cancel_callbacks( key, callback_func=None ):
+
+    if key not in _keyed:
+        return 0
+
+    handler = None
+
+    if callback_func != None:
+        handler = _get_handler( callback_func )
+
+    count = 0
+
+    for callback in list( _keyed[key] ):
+
+        if handler == None or callback.handler is handler:
+
+            if cancel_callback( callback ):
+                count += 1
+
+    return count
+
+##
+# Write any newly registered (or cancelled) events to the `events` journal.
+# The generator calls this once per sol, so that all the registrations
+# of a sol become a single bulk insert.
+def flush_callbacks( ):
+
+    if len( _journal ) == 0 and len( _tombstones ) == 0:
+        return
+
+    rows = []
+
+    for callback in _journal:
+
+        code = callback.handler.code
+        args = callback.handler.encode( callback.kwargs )
+
+        # not described by the handler, so fall back to the generic form
+        if args == None:
+            code = 0
+            args = json.dumps( callback.kwargs )
+
+        rows.append( {
+            "simulation_id": thisApp.simulation,
+            "registered": callback.registered,
+            "when": callback.when,
+            "idx": callback.idx,
+            # This allows us to pass a real function into the ergister function (rather then a string)
+            # but store the full name of the function for analysis
+            "callback_func": callback.handler.name,
+            "code": code,
+            "args": args,
+            "cancelled": callback.cancelled
+        } )
+
+        callback.journalled = True
+
+    try:
+        for chunk in peewee.chunked( rows, 100 ):
+
+            MODELS.Event.insert_many( chunk ).execute()
+
+        # ( cancelled, callback_func ) -> { when: [ idx ] }
+        tombstones = {}
+
+        for callback in _tombstones:
+
+            tombstones.setdefault(
+                ( callback.cancelled, callback.handler.name ), {}
+            ).setdefault( callback.when, [] ).append( callback.idx )
+
+        for ( ( cancelled, callback_func ), idxs ) in tombstones.items():
+
+            for chunk in peewee.chunked( idxs.items(), 100 ):
+
+                MODELS.Event.update(
+                    { MODELS.Event.cancelled: cancelled }
+                ).where(
+                    ( MODELS.Event.simulation_id == thisApp.simulation ) &
+                    ( MODELS.Event.callback_func == callback_func ) &
+                    functools.reduce( operator.or_, [
+                        ( MODELS.Event.when == when ) & ( MODELS.Event.idx.in_( idx ) ) for ( when, idx ) in chunk ] )
+                ).execute()
+
+    except Exception as e:
+        LOGGER.log( logging.FATAL, "%d.%03d Failed to journal %d events: %s", *UTILS.from_soldays( thisApp.solday ), len( rows ) + len( _tombstones ), str(e) )
+
+    _journal.clear()
+    _tombstones.clear()
+
+##
+# Rebuild the in-memory queue from the `events` journal.
+# Only needed by `--continue-simulation`, a new simulation
+# fills the queue as callbacks are registered.
+def load_callbacks( ):
+
+    _queue.clear()
+    _counters.clear()
+    _keyed.clear()
 
     query = MODELS.Event.select(
+        MODELS.Event.when,
+        MODELS.Event.registered,
         MODELS.Event.callback_func,
+        MODELS.Event.code,
         MODELS.Event.idx,
-        MODELS.Event.args
-    ).filter(
+        MODELS.Event.args,
+        MODELS.Event.cancelled
+    ).where(
         ( MODELS.Event.simulation_id == thisApp.simulation ) &
-        ( MODELS.Event.when == thisApp.solday )
+        ( MODELS.Event.when >= thisApp.solday )
+    ).order_by(
+        MODELS.Event.when,
+        MODELS.Event.id
     )
 
     for row in query.execute():
 
-        LOGGER.log( logging.DEBUG, '%d.%03d   Processing event %s()', *UTILS.from_soldays( thisApp.solday ), row.callback_func )
+        # cancelled events still used up an idx
+        counters = _counters.setdefault( row.when, {} )
+
+        counters[row.callback_func] = max( counters.get( row.callback_func, 0 ), row.idx + 1 )
+
+        if row.cancelled != None:
+            continue
 
         try:
+            if row.code:
+                handler = HANDLERS[row.code]
+                kwargs = handler.decode( row.args )
+            else:
+                handler = _get_handler( row.callback_func )
+                kwargs = json.loads( row.args )
 
-            mod_name, func_name = row.callback_func.rsplit('.',1)
+        except Exception as e:
+            LOGGER.error( '%d.%03d Failed to load event %s(): %s', *UTILS.from_soldays( thisApp.solday ), row.callback_func, str(e) )
+            continue
 
-            mod = importlib.import_module(mod_name)
+        callback = Callback( row.when, handler, row.idx, kwargs, row.registered )
 
-            kwargs = json.loads( row.args )
+        callback.journalled = True
 
-            kwargs['idx'] = row.idx
+        _push( callback )
 
-            func = getattr(mod, func_name)
+    LOGGER.log( thisApp.NOTICE, '%d.%03d Loaded %d pending events', *UTILS.from_soldays( thisApp.solday ), len( _queue ) )
 
-            LOGGER.log( thisApp.DETAILS, "%d.%03d Invoking callback %s( %s )", *UTILS.from_soldays( thisApp.solday ), row.callback_func, kwargs )
+##
+# Return the next event that is due today (or earlier), or None.
+# Cancelled events are discarded on the way
+def _next_due( ):
 
-            result = func( **kwargs )
+    while len( _queue ) and _queue[0][0] <= thisApp.solday:
 
-        except Exception as e:
-            LOGGER.error( '%d.%03d Failure during invocation of event callback %s(): %s )', *UTILS.from_soldays( thisApp.solday ), row.callback_func, str(e) )
+        callback = _queue[0][2]
+
+        if callback.cancelled == None:
+            return callback
+
+        _pop()
+
+    return None
+
+##
+# Return the solday of the next pending event, or None if nothing is scheduled
+def next_callback_solday( ):
+
+    # throw away any cancelled events
+    while len( _queue ) and _queue[0][2].cancelled != None:
+        _pop()
+
+    if len( _queue ):
+        return _queue[0][0]
+
+    return None
+
+##
+# \return the kwargs of the pending (not cancelled) events for `callback_func`
+def pending_callbacks( callback_func ):
 
+    handler = _get_handler( callback_func )
 
+    return [ callback.kwargs for ( _, _, callback ) in _queue if callback.handler is handler and callback.cancelled == None ]
+
+##
+# Run everything scheduled for today.
+#
+# Events are run in the order they were registered, consecutive events
+# with a batch handler are passed to it together. Only consecutive events
+# are grouped so that they still run in the same order relative to other
+# kinds of event (i.e. a birth still sees the deaths registered before it)
+#
+# Events stay in the queue until their turn comes, so an event can
+# still cancel events due later the same day
+def invoke_callbacks( ):
+
+    LOGGER.info( '%d.%03d Processing scheduled events', *UTILS.from_soldays( thisApp.solday ) )
 
+    while _next_due() != None:
 
+        callback = _pop()
 
+        # nothing else can be registered for this day
+        _counters.pop( callback.when, None )
+
+        # the database version only ever matched on today, so
+        # anything older was never run - keep it that way.
+        if callback.when < thisApp.solday:
+
+            LOGGER.error( '%d.%03d Dropping event %s() scheduled for %d.%03d', *UTILS.from_soldays( thisApp.solday ), callback.handler.name, *UTILS.from_soldays( callback.when ) )
+
+            continue
+
+        handler = callback.handler
+
+        run = [ callback ]
+
+        while handler.batch_func and _next_due() != None and _queue[0][2].handler is handler and _queue[0][0] == thisApp.solday:
+
+            run.append( _pop() )
+
+        for c in run:
+            c.kwargs['idx'] = c.idx
+
+        if len( run ) > 1:
+
+            LOGGER.log( logging.DEBUG, '%d.%03d   Processing %d events %s()', *UTILS.from_soldays( thisApp.solday ), len( run ), handler.name )
+
+            try:
+
+                result = handler.batch_func( [ c.kwargs for c in run ] )
+
+            except Exception as e:
+                LOGGER.error( '%d.%03d Failure during invocation of batch event callback %s(): %s )', *UTILS.from_soldays( thisApp.solday ), handler.name, str(e) )
+
+            continue
+
+        LOGGER.log( logging.DEBUG, '%d.%03d   Processing event %s()', *UTILS.from_soldays( thisApp.solday ), handler.name )
+
+        try:
+
+            LOGGER.log( thisApp.DETAILS, "%d.%03d Invoking callback %s( %s )", *UTILS.from_soldays( thisApp.solday ), handler.name, callback.kwargs )
+
+            result = handler.callback_func( **callback.kwargs )
+
+        except Exception as e:
+            LOGGER.error( '%d.%03d Failure during invocation of event callback %s(): %s )', *UTILS.from_soldays( thisApp.solday ), handler.name, str(e) )
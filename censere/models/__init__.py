@@ -7,6 +7,7 @@
 from .events import Event as Event
 from .settler import Settler as Settler
 from .settler import LocationEnum as LocationEnum
+from .settler import as_settler_id as as_settler_id
 from .astronaut import Astronaut as Astronaut
 from .martian import Martian as Martian
 
@@ -17,6 +18,48 @@ from .simulation import Simulation as Simulation
 
 from .summary import Summary as Summary
 
+from .census import Census as Census
+from .census import CENSUS as CENSUS
+
+from .singles import Singles as Singles
+from .singles import SINGLES as SINGLES
+
+from .pedigree import Pedigree as Pedigree
+from .pedigree import PEDIGREE as PEDIGREE
+
+from .policy import PolicyDecision as PolicyDecision
+from .policy import PolicyCache as PolicyCache
+from .policy import POLICY_CACHE as POLICY_CACHE
+
+from .residents import Resident as Resident
+from .residents import Residents as Residents
+from .residents import RESIDENTS as RESIDENTS
+
+from .partnerships import Partnerships as Partnerships
+from .partnerships import PARTNERSHIPS as PARTNERSHIPS
+from .partnerships import pair_key as pair_key
+
+from .vitals import Tally as Tally
+from .vitals import VitalStatistics as VitalStatistics
+from .vitals import VITALS as VITALS
+
+from .colony import Colony as Colony
+from .colony import COLONY as COLONY
+
+from .domain import Domain as Domain
+from .domain import DOMAIN as DOMAIN
+
+from .kinship import Kinship as Kinship
+from .kinship import KINSHIP as KINSHIP
+from .kinship import KinshipReport as KinshipReport
+
+from .policies import Pairs as Pairs
+from .policies import Policy as Policy
+from .policies import FamilyPolicy as FamilyPolicy
+from .policies import FAMILY_POLICY as FAMILY_POLICY
+from .policies import register_policy as register_policy
+
 from .demographics import Demographic as Demographic
 from .populations import Population as Population
 from .populations import get_population_histogram as get_population_histogram
+from .populations import parse_bins as parse_population_bins
@@ -0,0 +1,135 @@
+## Copyright (c) 2019,2023 Richard Offer. All right reserved.
+#
+# see LICENSE.md for license details
+
+# Live counts of the living population
+
+import collections
+import logging
+
+import peewee
+
+from censere.config import thisApp
+
+import censere.utils as UTILS
+
+from .settler import Settler as Settler
+
+LOGGER = logging.getLogger("c.m.census")
+DEVLOG = logging.getLogger("d.devel")
+
+##
+# Running totals of the living settlers in this simulation
+#
+# The generator needs the population and number of singles every
+# sol, rather than `COUNT(*)` the settlers table each time these
+# are kept up to date by the domain events (see domain.py) - anything
+# that changes a settler's death_solday or state has to go through them.
+#
+# state, sex and orientation are counted over all the living,
+# location is counted separately
+class Census( ):
+
+    def __init__( self ):
+
+        self.reset()
+
+    def reset( self ):
+
+        self.alive = 0
+
+        self.locations = collections.Counter()
+        self.states = collections.Counter()
+        self.sexes = collections.Counter()
+        self.orientations = collections.Counter()
+
+    ##
+    # Populate the counters from the database, needed when
+    # starting (or continuing) a simulation
+    def load( self ):
+
+        self.reset()
+
+        for ( location, state, sex, orientation, count ) in Census.query().tuples():
+
+            self.add( location, state, sex, orientation, count )
+
+    ##
+    # The living population, grouped the way the counters are
+    @staticmethod
+    def query( ):
+
+        return Settler.select(
+                Settler.current_location,
+                Settler.state,
+                Settler.sex,
+                Settler.orientation,
+                peewee.fn.COUNT( Settler.id )
+            ).where(
+                ( Settler.simulation_id == thisApp.simulation ) &
+                ( Settler.death_solday == 0 )
+            ).group_by(
+                Settler.current_location,
+                Settler.state,
+                Settler.sex,
+                Settler.orientation
+            )
+
+    ##
+    # `count` settlers were born, landed (or with a negative count, died)
+    def add( self, location, state, sex, orientation, count=1 ):
+
+        self.alive += count
+
+        self.locations[location] += count
+        self.states[state] += count
+        self.sexes[sex] += count
+        self.orientations[orientation] += count
+
+    def remove( self, location, state, sex, orientation, count=1 ):
+
+        self.add( location, state, sex, orientation, -count )
+
+    ##
+    # `count` living settlers changed from `old` state to `new`
+    def change_state( self, old, new, count=1 ):
+
+        self.states[old] -= count
+        self.states[new] += count
+
+    ##
+    # Compare the counters to the database, logging any differences
+    # and resynchronizing the counters if they have drifted
+    #
+    # \return True if the counters were correct
+    def check( self ):
+
+        expected = Census()
+
+        expected.load()
+
+        ok = True
+
+        for name in ( "alive", "locations", "states", "sexes", "orientations" ):
+
+            mine = getattr( self, name )
+            theirs = getattr( expected, name )
+
+            if isinstance( mine, collections.Counter ):
+                # ignore entries that have dropped to zero
+                mine = { k: v for ( k, v ) in mine.items() if v != 0 }
+                theirs = { k: v for ( k, v ) in theirs.items() if v != 0 }
+
+            if mine != theirs:
+
+                LOGGER.error( '%d.%03d (%d) Census %s is %s, database has %s', *UTILS.from_soldays( thisApp.solday ), thisApp.solday, name, mine, theirs )
+
+                ok = False
+
+        if not ok:
+            self.__dict__.update( expected.__dict__ )
+
+        return ok
+
+
+CENSUS = Census()
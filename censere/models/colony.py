@@ -0,0 +1,261 @@
+## Copyright (c) 2019,2023 Richard Offer. All right reserved.
+#
+# see LICENSE.md for license details
+
+# The colony held as NumPy columns, for --engine=memory
+
+import logging
+
+import numpy
+
+from censere.config import thisApp
+
+import censere.utils as UTILS
+
+from .settler import Settler as Settler
+from .settler import as_settler_id as as_settler_id
+
+LOGGER = logging.getLogger("c.m.colony")
+DEVLOG = logging.getLogger("d.devel")
+
+##
+# A growable int64 column, `values[:size]` are in use
+class Column( ):
+
+    def __init__( self, fill=0 ):
+
+        self.fill = fill
+        self.values = numpy.full( 1024, fill, dtype=numpy.int64 )
+
+    def reserve( self, size ):
+
+        if size > len( self.values ):
+
+            values = numpy.full( max( size, 2 * len( self.values ) ), self.fill, dtype=numpy.int64 )
+            values[:len( self.values )] = self.values
+
+            self.values = values
+
+##
+# Every settler of this simulation, living and dead, as parallel
+# NumPy columns with one row per settler in the order they arrived.
+#
+# The text columns (sex, orientation, state and locations) hold a
+# code, see code(), parents are the row of the parent or -1 for the
+# astronauts' parents on Earth.
+#
+# With --engine=memory the settlers are only written to the database
+# when the domain events are flushed, as each block of sols is
+# committed, and the summary and population histogram are counted
+# from here rather than queried. Kept up to date by the
+# domain events (see domain.py).
+class Colony( ):
+
+    COLUMNS = (
+        "birth_solday", "death_solday", "sex", "orientation", "state",
+        "birth_location", "current_location", "father", "mother", "cohort"
+    )
+
+    # the columns holding a code
+    TEXT = ( "sex", "orientation", "state", "birth_location", "current_location" )
+
+    def __init__( self ):
+
+        self.enabled = False
+
+        self.reset()
+
+    def reset( self ):
+
+        # column name -> [ value ] the text values, their position is the code
+        self.vocabulary = {}
+
+        self.columns = { c: Column( -1 if c in ( "father", "mother" ) else 0 ) for c in Colony.COLUMNS }
+        self.size = 0
+
+        # settler_id -> row, and row -> settler_id
+        self.index = {}
+        self.settler_ids = []
+
+        # the next Settler.id, the rows are only inserted when flushed
+        self.next_id = 1
+
+    ##
+    # \return the code of `value` in the text column `name`
+    def code( self, name, value ):
+
+        values = self.vocabulary.setdefault( name, [] )
+
+        try:
+            return values.index( value )
+        except ValueError:
+            values.append( value )
+            return len( values ) - 1
+
+    def __getitem__( self, name ):
+
+        return self.columns[name].values[:self.size]
+
+    def load( self, enabled=None ):
+
+        if enabled is not None:
+            self.enabled = enabled
+
+        self.reset()
+
+        if not self.enabled:
+            return
+
+        # the ids are shared by all the simulations in the database
+        self.next_id = ( Settler.select( Settler.id ).order_by( Settler.id.desc() ).limit( 1 ).scalar() or 0 ) + 1
+
+        for s in Settler.select(
+                Settler.settler_id,
+                Settler.birth_solday,
+                Settler.death_solday,
+                Settler.sex,
+                Settler.orientation,
+                Settler.state,
+                Settler.birth_location,
+                Settler.current_location,
+                Settler.biological_father,
+                Settler.biological_mother,
+                Settler.cohort
+            ).where(
+                ( Settler.simulation_id == thisApp.simulation )
+            ).order_by(
+                Settler.id
+            ):
+
+            self.add( s )
+
+    ##
+    # A settler has landed or been born
+    def add( self, instance ):
+
+        if not self.enabled:
+            return
+
+        i = self.size
+
+        for c in self.columns.values():
+            c.reserve( i + 1 )
+
+        values = {
+            "birth_solday": instance.birth_solday,
+            "death_solday": instance.death_solday,
+            "sex": self.code( "sex", instance.sex ),
+            "orientation": self.code( "orientation", instance.orientation ),
+            "state": self.code( "state", instance.state ),
+            "birth_location": self.code( "birth_location", instance.birth_location ),
+            "current_location": self.code( "current_location", instance.current_location ),
+            "father": self.index.get( as_settler_id( instance.biological_father ), -1 ),
+            "mother": self.index.get( as_settler_id( instance.biological_mother ), -1 ),
+            "cohort": instance.cohort,
+        }
+
+        for ( k, v ) in values.items():
+            self.columns[k].values[i] = v
+
+        self.index[instance.settler_id] = i
+        self.settler_ids.append( instance.settler_id )
+
+        self.size += 1
+
+    def _rows( self, settler_ids ):
+
+        return numpy.fromiter( ( self.index[ as_settler_id( i ) ] for i in settler_ids ), dtype=numpy.int64 )
+
+    def set_state( self, state, *settler_ids ):
+
+        if not self.enabled:
+            return
+
+        self.columns["state"].values[ self._rows( settler_ids ) ] = self.code( "state", state )
+
+    def died( self, settler_id, solday ):
+
+        if not self.enabled:
+            return
+
+        self.columns["death_solday"].values[ self.index[ as_settler_id( settler_id ) ] ] = solday
+
+    ##
+    # \return the column `name`, with the values rather than the codes of a text column
+    def decoded( self, name ):
+
+        if name not in Colony.TEXT:
+            return self[name]
+
+        return numpy.array( self.vocabulary.get( name, [] ), dtype=object )[ self[name] ]
+
+    ##
+    # \return { metric: number of settlers } of those meeting `where( c )`
+    # for each condition in `metrics( c )`, where `c( name )` is a
+    # decoded column. The same definitions are used for the database,
+    # see Summary.metrics()
+    def count( self, metrics, where ):
+
+        columns = {}
+
+        def column( name ):
+
+            if name not in columns:
+                columns[name] = self.decoded( name )
+
+            return columns[name]
+
+        counted = where( column )
+
+        return { k: int( ( counted & condition ).sum() ) for ( k, condition ) in metrics( column ).items() }
+
+    ##
+    # \return ( ages in soldays, sexes ) of the living
+    def ages( self ):
+
+        alive = self["death_solday"] == 0
+
+        return ( thisApp.solday - self["birth_solday"][alive], self.decoded( "sex" )[alive] )
+
+    ##
+    # Compare the columns to the database, logging any differences.
+    # Only meaningful once the domain events have been flushed
+    #
+    # \return True if they match
+    def check( self ):
+
+        if not self.enabled:
+            return True
+
+        expected = Colony()
+
+        expected.load( True )
+
+        ok = True
+
+        if expected.settler_ids != self.settler_ids:
+
+            LOGGER.error( '%d.%03d (%d) Colony has %d settlers, database has %d', *UTILS.from_soldays( thisApp.solday ), thisApp.solday, self.size, expected.size )
+
+            ok = False
+
+        else:
+
+            for c in Colony.COLUMNS:
+
+                if not numpy.array_equal( self.decoded( c ), expected.decoded( c ) ):
+
+                    LOGGER.error( '%d.%03d (%d) Colony column %s differs from the database', *UTILS.from_soldays( thisApp.solday ), thisApp.solday, c )
+
+                    ok = False
+
+        return ok
+
+    def stats( self ):
+
+        return {
+            "settlers": self.size,
+        }
+
+
+COLONY = Colony()
@@ -17,10 +17,10 @@ from censere.config import thisApp
 import censere.db as DB
 import censere.utils as UTILS
 
-from .summary import Summary as Summary
 from .settler import Settler as Settler
 from .relationship import Relationship as Relationship
 from .relationship import RelationshipEnum as RelationshipEnum
+from .vitals import VITALS as VITALS
 
 ##
 # Collect demographic details
@@ -52,6 +52,77 @@ class Demographic(playhouse.signals.Model):
     num_single_settlers = peewee.IntegerField( null=True, default=0 )
     num_partnered_settlers = peewee.IntegerField( null=True, default=0 )
 
+    ##
+    # The counting queries equivalent to the running totals initialize()
+    # uses (see vitals.py), keyed by the value they feed. Kept so that
+    # --check-census can check the totals against them
+    @staticmethod
+    def queries( ):
+
+        return {
+            "num_children_born": Settler.select().where(
+                ( Settler.simulation_id == thisApp.simulation ) &
+                ( Settler.birth_location == 'mars' ) &
+                ( Settler.birth_solday > max( thisApp.solday - 668, 0 ) ) &
+                ( Settler.birth_solday < thisApp.solday )
+            ),
+
+            "num_deaths": Settler.select().where(
+                ( Settler.simulation_id == thisApp.simulation ) &
+                ( Settler.current_location == 'mars' ) &
+                ( Settler.death_solday > max( thisApp.solday - 668, 0 ) ) &
+                ( Settler.death_solday < thisApp.solday )
+            ),
+
+            "num_partnerships_started": Relationship.select().where(
+                ( Relationship.simulation_id == thisApp.simulation ) &
+                ( Relationship.relationship == RelationshipEnum.partner ) &
+                ( Relationship.begin_solday > max( thisApp.solday - 668, 0 ) ) &
+                ( Relationship.begin_solday < thisApp.solday )
+            ),
+
+            "num_partnerships_ended": Relationship.select().where(
+                ( Relationship.simulation_id == thisApp.simulation ) &
+                ( Relationship.relationship == RelationshipEnum.partner ) &
+                ( Relationship.end_solday > max( thisApp.solday - 668, 0 ) ) &
+                ( Relationship.end_solday < thisApp.solday )
+            ),
+
+            "rel_year_start": Relationship.select().where(
+                ( Relationship.simulation_id == thisApp.simulation ) &
+                ( Relationship.relationship == RelationshipEnum.partner ) &
+                ( Relationship.begin_solday < max( thisApp.solday - 668, 0 ) ) &
+                (
+                    ( Relationship.end_solday == 0 ) |
+                    ( Relationship.end_solday < thisApp.solday )
+                )
+            ),
+
+            "rel_year_end": Relationship.select().where(
+                ( Relationship.simulation_id == thisApp.simulation ) &
+                ( Relationship.relationship == RelationshipEnum.partner ) &
+                ( Relationship.begin_solday < thisApp.solday ) &
+                (
+                    ( Relationship.end_solday == 0 ) |
+                    ( Relationship.end_solday < thisApp.solday )
+                )
+            ),
+
+            "num_single_settlers": Settler.select().where(
+                ( Settler.simulation_id == thisApp.simulation ) &
+                ( Settler.state == 'single' ) &
+                ( Settler.death_solday == 0 ) &
+                ( Settler.birth_solday < (thisApp.solday - UTILS.years_to_sols(18) ) )
+            ),
+
+            "num_partnered_settlers": Settler.select().where(
+                ( Settler.simulation_id == thisApp.simulation ) &
+                ( Settler.state == 'couple' ) &
+                ( Settler.death_solday == 0 ) &
+                ( Settler.birth_solday < (thisApp.solday - UTILS.years_to_sols(18) ) )
+            )
+        }
+
     def initialize( self ):
 
         self.simulation_id = thisApp.simulation
@@ -59,31 +130,15 @@ class Demographic(playhouse.signals.Model):
         self.solday = thisApp.solday
         self.earth_datetime = thisApp.earth_time
 
-        num_children_born = Settler.select().where(
-            ( Settler.simulation_id == thisApp.simulation ) &
-            ( Settler.birth_location == 'mars' ) &
-            ( Settler.birth_solday > max( thisApp.solday - 668, 0 ) ) &
-            ( Settler.birth_solday < thisApp.solday )
-            ).count()
-
-        num_deaths = Settler.select().where(
-            ( Settler.simulation_id == thisApp.simulation ) &
-            ( Settler.current_location == 'mars' ) &
-            ( Settler.death_solday > max( thisApp.solday - 668, 0 ) ) &
-            ( Settler.death_solday < thisApp.solday )
-            ).count()
-
-        year_start = Summary.get(
-            ( Summary.simulation_id == thisApp.simulation ) &
-            ( Summary.solday == max( thisApp.solday - (thisApp.solday % 668),0 ) )
-            )
+        counts = VITALS.counts()
 
-        year_end = Summary.get(
-            ( Summary.simulation_id == thisApp.simulation ) &
-            ( Summary.solday == thisApp.solday )
-            )
+        num_children_born = counts["num_children_born"]
+
+        num_deaths = counts["num_deaths"]
+
+        ( population_start, population_end ) = VITALS.populations()
 
-        avg_population = year_start.population + int( 0.5 * ( year_end.population - year_start.population ) )
+        avg_population = population_start + int( 0.5 * ( population_end - population_start ) )
 
         # average are normally reported as rates per 1000 people
         if avg_population > 0 :
@@ -93,54 +148,17 @@ class Demographic(playhouse.signals.Model):
             self.avg_annual_birth_rate = 0.0
             self.avg_annual_death_rate = 0.0
 
+        self.num_partnerships_started = counts["num_partnerships_started"]
 
-        self.num_partnerships_started = Relationship.select().where(
-            ( Relationship.simulation_id == thisApp.simulation ) &
-            ( Relationship.relationship == RelationshipEnum.partner ) &
-            ( Relationship.begin_solday > max( thisApp.solday - 668, 0 ) ) &
-            ( Relationship.begin_solday < thisApp.solday )
-            ).count()
-
-        self.num_partnerships_ended = Relationship.select().where(
-            ( Relationship.simulation_id == thisApp.simulation ) &
-            ( Relationship.relationship == RelationshipEnum.partner ) &
-            ( Relationship.end_solday > max( thisApp.solday - 668, 0 ) ) &
-            ( Relationship.end_solday < thisApp.solday )
-            ).count()
-
-        rel_year_start = Relationship.select().where(
-            ( Relationship.simulation_id == thisApp.simulation ) &
-            ( Relationship.relationship == RelationshipEnum.partner ) &
-            ( Relationship.begin_solday < max( thisApp.solday - 668, 0 ) ) &
-            (
-                ( Relationship.end_solday == 0 ) |
-                ( Relationship.end_solday < thisApp.solday )
-            )
-            ).count()
-
-        rel_year_end = Relationship.select().where(
-            ( Relationship.simulation_id == thisApp.simulation ) &
-            ( Relationship.relationship == RelationshipEnum.partner ) &
-            ( Relationship.begin_solday < thisApp.solday ) &
-            (
-                ( Relationship.end_solday == 0 ) |
-                ( Relationship.end_solday < thisApp.solday )
-            )
-            ).count()
+        self.num_partnerships_ended = counts["num_partnerships_ended"]
+
+        rel_year_start = counts["rel_year_start"]
+
+        rel_year_end = counts["rel_year_end"]
 
         self.avg_partnerships = rel_year_start + int( 0.5 * ( rel_year_end - rel_year_start ) )
 
-        self.num_single_settlers = Settler.select().where(
-            ( Settler.simulation_id == thisApp.simulation ) &
-            ( Settler.state == 'single' ) &
-            ( Settler.death_solday == 0 ) &
-            ( Settler.birth_solday < (thisApp.solday - UTILS.years_to_sols(18) ) )
-            ).count()
-
-        self.num_partnered_settlers = Settler.select().where(
-            ( Settler.simulation_id == thisApp.simulation ) &
-            ( Settler.state == 'couple' ) &
-            ( Settler.death_solday == 0 ) &
-            ( Settler.birth_solday < (thisApp.solday - UTILS.years_to_sols(18) ) )
-            ).count()
+        self.num_single_settlers = counts["num_single_settlers"]
+
+        self.num_partnered_settlers = counts["num_partnered_settlers"]
 
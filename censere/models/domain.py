@@ -0,0 +1,381 @@
+## Copyright (c) 2019,2023 Richard Offer. All right reserved.
+#
+# see LICENSE.md for license details
+
+# The domain events of the simulation and their consequences
+
+import logging
+
+import peewee
+
+from censere.config import thisApp
+
+import censere.utils as UTILS
+import censere.utils.random as RANDOM
+
+from .census import CENSUS as CENSUS
+from .singles import SINGLES as SINGLES
+from .pedigree import PEDIGREE as PEDIGREE
+from .kinship import KINSHIP as KINSHIP
+from .partnerships import PARTNERSHIPS as PARTNERSHIPS
+from .residents import RESIDENTS as RESIDENTS
+from .colony import COLONY as COLONY
+from .vitals import VITALS as VITALS
+from .settler import Settler as Settler
+from .settler import as_settler_id as as_settler_id
+from .settler import LocationEnum as LocationEnum
+from .relationship import Relationship as Relationship
+from .relationship import RelationshipEnum as RelationshipEnum
+
+LOGGER = logging.getLogger("c.m.domain")
+DEVLOG = logging.getLogger("d.devel")
+
+##
+# Everything that follows from a settler landing, being born or dying,
+# and from a partnership starting or ending.
+#
+# The event handlers call these (rather than relying on save() triggers)
+# so the in-memory census, pool of singles, pedigree, kinship matrix,
+# partnerships and residents are updated straight away, but the
+# consequences in the database - the settlers' state, the parent links
+# and their generational fan-out, the end of relationships and deaths -
+# are collected and written with set based SQL by flush().
+#
+# With --engine=sql the new settlers are saved straight away, and the
+# generator flushes at the end of each sol so the database is up to date
+# for the summaries. With --engine=memory the settlers are given their
+# row id and queued too, the summaries are counted from the colony (see
+# colony.py) and the generator only flushes as each block of sols is
+# committed. Either way everything is written with insert_many() and
+# update() as nothing depends on a per-row hook, and the SQL pairing
+# flushes before its query.
+class Domain( ):
+
+    def __init__( self ):
+
+        self.reset()
+
+    def reset( self ):
+
+        # new settlers to insert, in the order they arrived
+        self.settlers = []
+
+        # new relationships to insert, in the order they were made
+        self.relationships = []
+
+        # first -> [ ( second, relationship ) ] of the parent and
+        # ancestor relationships in `relationships`
+        self.links = {}
+
+        # settler_id -> state
+        self.states = {}
+
+        # relationship_id -> end_solday
+        self.ended = {}
+
+        # settler_id -> death_solday
+        self.deaths = {}
+
+    def _relationship( self, relationship_id, first, second, relationship ):
+
+        if relationship > 0:
+            self.links.setdefault( as_settler_id( first ), [] ).append( ( second, relationship ) )
+
+        self.relationships.append( {
+            "simulation_id": thisApp.simulation,
+            "relationship_id": relationship_id,
+            "first": first,
+            "second": second,
+            "relationship": relationship,
+            "begin_solday": thisApp.solday
+        } )
+
+    ##
+    # Move the living settlers in `settler_ids` from state `old` to `new`
+    def _change_state( self, old, new, settler_ids ):
+
+        living = [ i for i in set( as_settler_id( i ) for i in settler_ids ) if RESIDENTS.get( i ) is not None ]
+
+        for i in living:
+            self.states[i] = new
+
+        CENSUS.change_state( old, new, len( living ) )
+
+        RESIDENTS.set_state( new, *living )
+
+        COLONY.set_state( new, *living )
+
+    ##
+    # The ( second, relationship level ) of the relationships that
+    # `settler_id` has to their parents and ancestors, including any
+    # not yet flushed, in the order the relationships index returns them
+    def _ancestors( self, settler_id ):
+
+        rows = [ ( row.second, row.relationship ) for row in Relationship.select(
+                Relationship.second,
+                Relationship.relationship
+            ).where(
+                ( Relationship.first == settler_id ) &
+                # not a partner relationship
+                ( Relationship.relationship > 0 ) ) ]
+
+        rows.extend( self.links.get( as_settler_id( settler_id ), [] ) )
+
+        # stable, so it stays in row order within a level
+        rows.sort( key=lambda r: r[1] )
+
+        return rows
+
+    ##
+    # A settler has landed or been born.
+    # Astronauts get a link to each of their parents on Earth
+    def settler_added( self, instance ):
+
+        if thisApp.engine == 'memory':
+
+            instance.id = COLONY.next_id
+            COLONY.next_id += 1
+
+            self.settlers.append( dict( instance.__data__ ) )
+
+        else:
+            instance.save()
+
+        COLONY.add( instance )
+
+        VITALS.added( instance )
+
+        CENSUS.add( instance.current_location, instance.state, instance.sex, instance.orientation )
+
+        SINGLES.add( instance.settler_id, instance.birth_solday, instance.id, instance.sex, instance.orientation, instance.first_name, instance.family_name, instance.state )
+
+        RESIDENTS.add( instance )
+
+        PEDIGREE.add_settler( instance.settler_id, instance.biological_father, instance.biological_mother )
+
+        KINSHIP.add_settler( instance.settler_id, instance.biological_father, instance.biological_mother )
+
+        if instance.birth_location == LocationEnum.Earth:
+
+            self.parent_linked( instance.settler_id, instance.biological_father )
+            self.parent_linked( instance.settler_id, instance.biological_mother )
+
+    ##
+    # `parent` is one of the biological parents of `child`.
+    #
+    # With --relationship-storage=generational the parent's own
+    # relationships are copied onto the child, one level further away
+    #
+    # \return the relationship_id of the link
+    def parent_linked( self, child, parent, relationship_id=None ):
+
+        if relationship_id is None:
+            relationship_id = RANDOM.id()
+
+        self._relationship( relationship_id, child, parent, RelationshipEnum.parent )
+
+        # only the direct link is stored, the relationships_expanded
+        # view derives the rest (and the policy uses the pedigree)
+        if thisApp.relationship_storage == 'direct':
+            return relationship_id
+
+        for ( second, relationship ) in self._ancestors( parent ):
+
+            # increase the relationship level
+            self._relationship( RANDOM.id(), child, second, relationship + 1 )
+
+        return relationship_id
+
+    ##
+    # Two singles have become a couple
+    def partnership_started( self, relationship_id, first, second ):
+
+        self._relationship( relationship_id, first, second, RelationshipEnum.partner )
+
+        self._change_state( 'single', 'couple', ( first, second ) )
+
+        SINGLES.paired( first, second )
+
+        PEDIGREE.add_partner( first, second )
+
+        PARTNERSHIPS.started( relationship_id, first, second )
+
+        VITALS.partnership_started( relationship_id, thisApp.solday )
+
+        KINSHIP.partnered( first, second )
+
+        LOGGER.log( logging.INFO, '%d.%03d Created new family %s', *UTILS.from_soldays( thisApp.solday ), relationship_id )
+        LOGGER.log( thisApp.DETAILS, '%d.%03d Created new family between %s and %s', *UTILS.from_soldays( thisApp.solday ), first, second )
+
+    ##
+    # Partnerships have ended while both partners are alive,
+    # the partners are single again
+    #
+    # \return the relationship_ids that were active, the rest are ignored
+    def partnerships_ended( self, relationship_ids ):
+
+        ended = []
+        partners = []
+
+        for relationship_id in relationship_ids:
+
+            pair = PARTNERSHIPS.of_relationship( relationship_id )
+
+            if pair is None:
+                continue
+
+            PARTNERSHIPS.ended( relationship_id )
+            VITALS.partnership_ended( relationship_id, thisApp.solday )
+
+            self.ended[relationship_id] = thisApp.solday
+
+            ended.append( relationship_id )
+            partners.extend( pair )
+
+        self._change_state( 'couple', 'single', partners )
+
+        SINGLES.separated( *partners )
+
+        return ended
+
+    ##
+    # Settlers have died, in this order. When a person dies only their
+    # partner relationships end, the parent/child links are kept
+    #
+    # \return ( dying, ended ) the settler_ids of those that were alive,
+    #         and the relationship_ids of the partnerships that ended
+    def settlers_died( self, settler_ids ):
+
+        # keep the order they died in
+        dying = [ i for i in settler_ids if RESIDENTS.get( i ) is not None ]
+
+        relationships = {}
+
+        for i in dying:
+
+            relationships.update( PARTNERSHIPS.of( i ) )
+
+        # replay the deaths in order - a partner who dies later on the
+        # same sol was still alive (and so made single) when the
+        # earlier death ended the relationship.
+        dead = set()
+        ended = []
+        singles = set()
+
+        for i in dying:
+
+            dead.add( i )
+
+            for ( relationship_id, partners ) in relationships.items():
+
+                if i not in partners or relationship_id in ended:
+                    continue
+
+                ended.append( relationship_id )
+
+                LOGGER.info( "%d.%03d Relationship %s ended. Death of %s %s",
+                    *UTILS.from_soldays( thisApp.solday ),
+                    relationship_id,
+                    RESIDENTS.get( i ).first_name,
+                    RESIDENTS.get( i ).family_name )
+
+                singles.update( p for p in partners if p not in dead )
+
+        self._change_state( 'couple', 'single', singles )
+
+        SINGLES.separated( *singles )
+
+        for relationship_id in ended:
+
+            PARTNERSHIPS.ended( relationship_id )
+            VITALS.partnership_ended( relationship_id, thisApp.solday )
+
+            self.ended[relationship_id] = thisApp.solday
+
+        for i in dying:
+
+            self.deaths[i] = thisApp.solday
+
+            r = RESIDENTS.get( i )
+
+            # anyone made single earlier in the sol dies single
+            CENSUS.remove( r.current_location, r.state, r.sex, r.orientation )
+
+            VITALS.died( r, thisApp.solday )
+
+            SINGLES.remove( i )
+            RESIDENTS.died( i, thisApp.solday )
+            COLONY.died( i, thisApp.solday )
+
+            PEDIGREE.died( i )
+            KINSHIP.died( i )
+
+        return ( dying, ended )
+
+    ##
+    # Write the collected consequences to the database
+    def flush( self ):
+
+        for chunk in peewee.chunked( self.settlers, 50 ):
+
+            Settler.insert_many( chunk ).execute()
+
+        for chunk in peewee.chunked( self.relationships, 100 ):
+
+            Relationship.insert_many( chunk ).execute()
+
+        for state in sorted( set( self.states.values() ) ):
+
+            ids = [ i for ( i, s ) in self.states.items() if s == state ]
+
+            for chunk in peewee.chunked( ids, 500 ):
+
+                Settler.update(
+                    { Settler.state: state }
+                ).where(
+                    ( Settler.settler_id.in_( chunk ) ) &
+                    ( Settler.simulation_id == thisApp.simulation )
+                ).execute()
+
+        for solday in sorted( set( self.ended.values() ) ):
+
+            ids = [ i for ( i, s ) in self.ended.items() if s == solday ]
+
+            for chunk in peewee.chunked( ids, 500 ):
+
+                Relationship.update(
+                    { Relationship.end_solday: solday }
+                ).where(
+                    ( Relationship.relationship_id.in_( chunk ) ) &
+                    ( Relationship.simulation_id == thisApp.simulation )
+                ).execute()
+
+        for solday in sorted( set( self.deaths.values() ) ):
+
+            ids = [ i for ( i, s ) in self.deaths.items() if s == solday ]
+
+            for chunk in peewee.chunked( ids, 500 ):
+
+                Settler.update(
+                    { Settler.death_solday: solday }
+                ).where(
+                    ( Settler.settler_id.in_( chunk ) ) &
+                    ( Settler.simulation_id == thisApp.simulation )
+                ).execute()
+
+        RESIDENTS.flush()
+
+        self.reset()
+
+    def stats( self ):
+
+        return {
+            "settlers": len( self.settlers ),
+            "relationships": len( self.relationships ),
+            "states": len( self.states ),
+            "ended": len( self.ended ),
+            "deaths": len( self.deaths ),
+        }
+
+
+DOMAIN = Domain()
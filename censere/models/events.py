@@ -31,8 +31,15 @@ class Event(playhouse.signals.Model):
 
     callback_func = peewee.CharField( 64 )
 
+    # registered handler code (see events/store.py), 0 means
+    # `callback_func` is imported by name and `args` is JSON
+    code = peewee.IntegerField( default=0 )
+
     idx = peewee.IntegerField( default=0 )
 
     args = peewee.TextField( default="{}" )
 
+    # solday the event was cancelled on (it never ran)
+    cancelled = peewee.IntegerField( null=True )
+
 
@@ -6,9 +6,8 @@
 
 import logging
 
-import functools
-
-import censere.models
+from .pedigree import PEDIGREE as PEDIGREE
+from .policy import POLICY_CACHE as POLICY_CACHE
 
 LOGGER = logging.getLogger("c.m.functions")
 DEVLOG = logging.getLogger("d.devel")
@@ -29,10 +28,10 @@ DEVLOG = logging.getLogger("d.devel")
 #  * familes can be extended (more than 2 people) - this would require code changes in families.make()
 #  * social policy changes means that only hetrosexual couples are allowed.
 #
-# This is cached to improve performace as we're calling it with the same people
-# everyday - and once denied its not likely the result will change
-# Unfortunelty - there's no way to configure this at runtime
-@functools.lru_cache(maxsize=65536)
+# Relatives come from the in-memory pedigree (models/pedigree.py) so this
+# is a set intersection with no database access. Decisions are memoized
+# in POLICY_CACHE (models/policy.py), which keeps the refusals across
+# --continue-simulation.
 def family_policy( *args ):
 
     allowed = False
@@ -42,22 +41,15 @@ def family_policy( *args ):
     id_1 = args[1]
     id_2 = args[2]
 
-    try:
+    cached = POLICY_CACHE.get( common_ancestor, id_1, id_2 )
 
-        relatives_1 = set()
-        relatives_2 = set()
+    if cached is not None:
+        return cached
 
-        for r1 in censere.models.Relationship.select(censere.models.Relationship.second).where( 
-                ( censere.models.Relationship.first == id_1 ) &
-                ( censere.models.Relationship.relationship <= common_ancestor ) 
-            ).tuples():
-            relatives_1.add( str(r1[0]) )
+    try:
 
-        for r2 in censere.models.Relationship.select(censere.models.Relationship.second).where( 
-                ( censere.models.Relationship.first == id_2 ) &
-                ( censere.models.Relationship.relationship <= common_ancestor ) 
-            ).tuples():
-            relatives_2.add( str(r2[0]) )
+        relatives_1 = PEDIGREE.relatives( id_1, common_ancestor )
+        relatives_2 = PEDIGREE.relatives( id_2, common_ancestor )
 
         # This blocks siblings - all ancestors are the same
         if relatives_1 == relatives_2:
@@ -71,6 +63,8 @@ def family_policy( *args ):
         else:
             LOGGER.log( logging.DEBUG, '%s and %s overlap by %d', id_1, id_2, overlap )
 
+        POLICY_CACHE.put( common_ancestor, id_1, id_2, allowed )
+
     except Exception as e:
 
         LOGGER.log( logging.ERROR, 'Caught exception %s', str(e) )
@@ -82,5 +76,9 @@ def family_policy( *args ):
 
 def register_all( db ):
 
+    # policies.py builds on family_policy(), so is imported here
+    from .policies import pair_policy
+
     db.register_function( family_policy, "app_family_policy", num_params=3 )
+    db.register_function( pair_policy, "app_pair_policy", num_params=2 )
 
@@ -0,0 +1,295 @@
+## Copyright (c) 2019,2023 Richard Offer. All right reserved.
+#
+# see LICENSE.md for license details
+
+# Kinship coefficients of the living, and the annual inbreeding report
+
+import logging
+
+import peewee
+import playhouse.signals
+
+import censere.db as DB
+
+from censere.config import thisApp
+
+from .settler import Settler as Settler
+from .settler import as_settler_id as as_settler_id
+from .settler import LocationEnum as LocationEnum
+from .relationship import Relationship as Relationship
+from .relationship import RelationshipEnum as RelationshipEnum
+
+LOGGER = logging.getLogger("c.m.kinship")
+DEVLOG = logging.getLogger("d.devel")
+
+##
+# Sparse, symmetric matrix of kinship coefficients, i.e. the
+# probability that an allele picked at random from each of two
+# settlers is identical by descent.
+#
+# The astronauts are the founders, unrelated to each other with a
+# self-kinship of 1/2. A child's row is the average of their parents'
+# rows, and their self-kinship is 1/2 ( 1 + kinship of the parents ).
+# Only the non-zero entries are kept, so a birth costs the size of
+# the parents' rows - the number of their living relatives - and
+# not the size of the colony.
+#
+# A parent can die before their child is born (a father's pending
+# births aren't cancelled when he dies), so the dead are only dropped
+# by expire() once no pending birth names them.
+#
+# Updated by the domain events (see domain.py), as is the pedigree.
+class Kinship( ):
+
+    def __init__( self ):
+
+        self.enabled = False
+
+        self.reset()
+
+    def reset( self ):
+
+        # settler_id -> int
+        self.index = {}
+
+        # int -> { int: kinship }, including their own self-kinship
+        self.rows = {}
+
+        # the dead still in `rows`
+        self.dead = []
+
+        self.clear()
+
+    ##
+    # Start a new reporting period
+    def clear( self ):
+
+        self.partnerships = []
+        self.births = []
+
+    ##
+    # Rebuild the matrix (and the current report) from the database
+    def load( self, enabled=None ):
+
+        if enabled is not None:
+            self.enabled = enabled
+
+        self.reset()
+
+        if not self.enabled:
+            return
+
+        # in row id order parents are always added before their children,
+        # the dead are expired at the next report, once the pending
+        # births are known
+        for ( settler_id, father, mother, death_solday ) in Settler.select(
+                Settler.settler_id,
+                Settler.biological_father,
+                Settler.biological_mother,
+                Settler.death_solday
+            ).where(
+                ( Settler.simulation_id == thisApp.simulation )
+            ).order_by(
+                Settler.id
+            ).tuples():
+
+            self.add_settler( settler_id, father, mother )
+
+            if death_solday != 0:
+                self.died( settler_id )
+
+        # what has happened since the last report
+        report_solday = thisApp.solday - ( thisApp.solday % 668 )
+
+        self.clear()
+
+        for ( settler_id, father, mother ) in Settler.select(
+                Settler.settler_id,
+                Settler.biological_father,
+                Settler.biological_mother
+            ).where(
+                ( Settler.simulation_id == thisApp.simulation ) &
+                ( Settler.birth_location == LocationEnum.Mars ) &
+                ( Settler.birth_solday >= report_solday )
+            ).order_by(
+                Settler.id
+            ).tuples():
+
+            self.births.append( self.kinship( father, mother ) )
+
+        for ( first, second ) in Relationship.select(
+                Relationship.first,
+                Relationship.second
+            ).where(
+                ( Relationship.simulation_id == thisApp.simulation ) &
+                ( Relationship.relationship == RelationshipEnum.partner ) &
+                ( Relationship.begin_solday >= report_solday )
+            ).order_by(
+                Relationship.id
+            ).tuples():
+
+            self.partnered( first, second )
+
+    def _intern( self, settler_id ):
+
+        settler_id = as_settler_id( settler_id )
+
+        i = self.index.get( settler_id )
+
+        if i is None:
+            i = len( self.index )
+            self.index[settler_id] = i
+
+        return i
+
+    ##
+    # \return the kinship coefficient of two settlers, 0.0 if either is unknown
+    def kinship( self, id_1, id_2 ):
+
+        i = self.index.get( as_settler_id( id_1 ) )
+        j = self.index.get( as_settler_id( id_2 ) )
+
+        if i is None or j is None or i not in self.rows:
+            return 0.0
+
+        return self.rows[i].get( j, 0.0 )
+
+    ##
+    # A settler has landed or been born.
+    # Parents that aren't in the matrix (the astronauts' parents
+    # on Earth) are treated as unrelated founders
+    def add_settler( self, settler_id, father, mother ):
+
+        if not self.enabled:
+            return
+
+        father_row = self.rows.get( self.index.get( as_settler_id( father ) ), {} )
+        mother_row = self.rows.get( self.index.get( as_settler_id( mother ) ), {} )
+
+        i = self._intern( settler_id )
+
+        row = {}
+
+        for ( j, k ) in father_row.items():
+            row[j] = 0.5 * k
+
+        for ( j, k ) in mother_row.items():
+            row[j] = row.get( j, 0.0 ) + 0.5 * k
+
+        for ( j, k ) in row.items():
+            self.rows[j][i] = k
+
+        row[i] = 0.5 * ( 1.0 + father_row.get( self.index.get( as_settler_id( mother ) ), 0.0 ) )
+
+        self.rows[i] = row
+
+        if father_row or mother_row:
+            # the inbreeding coefficient of the child
+            self.births.append( 2.0 * row[i] - 1.0 )
+
+    def partnered( self, first, second ):
+
+        if not self.enabled:
+            return
+
+        self.partnerships.append( self.kinship( first, second ) )
+
+    def died( self, settler_id ):
+
+        if not self.enabled:
+            return
+
+        i = self.index.get( as_settler_id( settler_id ) )
+
+        if i is not None and i in self.rows:
+            self.dead.append( i )
+
+    ##
+    # Drop the dead from the matrix, except those in `parents`
+    # (the settler_ids named by pending births)
+    def expire( self, parents=() ):
+
+        keep = set( self.index.get( as_settler_id( p ) ) for p in parents )
+
+        dead = []
+
+        for i in self.dead:
+
+            if i in keep:
+                dead.append( i )
+                continue
+
+            for j in self.rows.pop( i, {} ):
+                if j != i:
+                    self.rows[j].pop( i, None )
+
+        self.dead = dead
+
+    ##
+    # Summarize, and then clear, the current reporting period
+    def report( self ):
+
+        values = {
+            "num_partnerships": len( self.partnerships ),
+            "avg_partnership_kinship": sum( self.partnerships ) / len( self.partnerships ) if self.partnerships else 0.0,
+            "max_partnership_kinship": max( self.partnerships, default=0.0 ),
+            "num_births": len( self.births ),
+            "avg_inbreeding": sum( self.births ) / len( self.births ) if self.births else 0.0,
+            "max_inbreeding": max( self.births, default=0.0 ),
+        }
+
+        self.clear()
+
+        return values
+
+    def stats( self ):
+
+        return {
+            "settlers": len( self.rows ),
+            "entries": sum( len( r ) for r in self.rows.values() ),
+            "dead": len( self.dead ),
+        }
+
+
+KINSHIP = Kinship()
+
+##
+# Inbreeding in the colony, one row per sol-year when --kinship-report is given
+#
+class KinshipReport( playhouse.signals.Model ):
+
+    class Meta:
+        database = DB.db
+
+        table_name = 'kinship'
+
+    # Unique identifier for the simulation
+    simulation_id = peewee.UUIDField( )
+
+    solday = peewee.IntegerField( )
+    earth_datetime = peewee.DateTimeField()
+
+    # kinship coefficients of the partnerships started this year
+    num_partnerships = peewee.IntegerField( default=0 )
+    avg_partnership_kinship = peewee.FloatField( default=0.0 )
+    max_partnership_kinship = peewee.FloatField( default=0.0 )
+
+    # inbreeding coefficients of the children born this year
+    num_births = peewee.IntegerField( default=0 )
+    avg_inbreeding = peewee.FloatField( default=0.0 )
+    max_inbreeding = peewee.FloatField( default=0.0 )
+
+    # non-zero entries held for the living (and the dead with children to come)
+    matrix_entries = peewee.IntegerField( default=0 )
+
+    def initialize( self ):
+
+        self.simulation_id = thisApp.simulation
+
+        self.solday = thisApp.solday
+        self.earth_datetime = thisApp.earth_time
+
+        for ( k, v ) in KINSHIP.report().items():
+            setattr( self, k, v )
+
+        self.matrix_entries = KINSHIP.stats()["entries"]
@@ -0,0 +1,126 @@
+## Copyright (c) 2019,2023 Richard Offer. All right reserved.
+#
+# see LICENSE.md for license details
+
+# The partnerships that haven't ended yet
+
+import logging
+
+from censere.config import thisApp
+
+from .settler import as_settler_id as as_settler_id
+from .relationship import Relationship as Relationship
+from .relationship import RelationshipEnum as RelationshipEnum
+
+LOGGER = logging.getLogger("c.m.partnerships")
+DEVLOG = logging.getLogger("d.devel")
+
+##
+# The canonical key for a couple, the same whichever way
+# round they are in the relationship
+def pair_key( id_1, id_2 ):
+
+    id_1 = as_settler_id( id_1 )
+    id_2 = as_settler_id( id_2 )
+
+    if id_2 < id_1:
+        return ( id_2, id_1 )
+
+    return ( id_1, id_2 )
+
+##
+# The active (end_solday == 0) partner relationships of this simulation,
+# keyed by the couple and by each partner, so that "are these two
+# together?" and "who is this settler with?" don't need a query.
+#
+# Kept up to date by the domain events (see domain.py).
+class Partnerships( ):
+
+    def __init__( self ):
+
+        self.reset()
+
+    def reset( self ):
+
+        # pair_key -> relationship_id
+        self.pairs = {}
+
+        # relationship_id -> ( first, second )
+        self.relationships = {}
+
+        # settler_id -> [ relationship_id ]
+        self.settlers = {}
+
+    def load( self ):
+
+        self.reset()
+
+        for ( relationship_id, first, second ) in Relationship.select(
+                Relationship.relationship_id,
+                Relationship.first,
+                Relationship.second
+            ).where(
+                ( Relationship.simulation_id == thisApp.simulation ) &
+                ( Relationship.relationship == RelationshipEnum.partner ) &
+                ( Relationship.end_solday == 0 )
+            ).order_by(
+                Relationship.id
+            ).tuples():
+
+            self.started( relationship_id, first, second )
+
+    def started( self, relationship_id, first, second ):
+
+        first = as_settler_id( first )
+        second = as_settler_id( second )
+
+        self.pairs[ pair_key( first, second ) ] = relationship_id
+        self.relationships[ relationship_id ] = ( first, second )
+
+        self.settlers.setdefault( first, [] ).append( relationship_id )
+        self.settlers.setdefault( second, [] ).append( relationship_id )
+
+    ##
+    # ids of relationships that were not active are ignored
+    def ended( self, relationship_id ):
+
+        partners = self.relationships.pop( relationship_id, None )
+
+        if partners is None:
+            return
+
+        self.pairs.pop( pair_key( *partners ), None )
+
+        for p in partners:
+
+            self.settlers[p].remove( relationship_id )
+
+            if len( self.settlers[p] ) == 0:
+                del self.settlers[p]
+
+    ##
+    # \return the relationship_id of the couple's active partnership, or None
+    def find( self, id_1, id_2 ):
+
+        return self.pairs.get( pair_key( id_1, id_2 ) )
+
+    ##
+    # \return ( first, second ) of an active partnership, or None
+    def of_relationship( self, relationship_id ):
+
+        return self.relationships.get( relationship_id )
+
+    ##
+    # \return { relationship_id: ( first, second ) } the settler's active partnerships
+    def of( self, settler_id ):
+
+        return { r: self.relationships[r] for r in self.settlers.get( as_settler_id( settler_id ), () ) }
+
+    def stats( self ):
+
+        return {
+            "active": len( self.relationships ),
+        }
+
+
+PARTNERSHIPS = Partnerships()
@@ -0,0 +1,179 @@
+## Copyright (c) 2019,2023 Richard Offer. All right reserved.
+#
+# see LICENSE.md for license details
+
+# In memory family tree used by the family policy
+
+import logging
+
+from censere.config import thisApp
+
+from .settler import Settler as Settler
+from .settler import as_settler_id as as_settler_id
+from .relationship import Relationship as Relationship
+from .relationship import RelationshipEnum as RelationshipEnum
+
+LOGGER = logging.getLogger("c.m.pedigree")
+DEVLOG = logging.getLogger("d.devel")
+
+##
+# Parent pointers for everyone in the simulation (including the
+# astronauts' parents back on Earth) so that the family policy can
+# compare relatives without reading the relationships table.
+#
+# A settler's relatives are the same as the `relationships` rows
+# with them as `first` and `relationship <= common_ancestor`, i.e.
+# their ancestors up to that many generations *and* any partner
+# where they were `first` in the partnership.
+#
+# Settlers are interned as small integers. Ancestor sets are only
+# kept for the living, so memory is bounded by
+#   everyone * 2 parent pointers + living * ( 2^(generations+1) - 2 )
+# see stats()
+class Pedigree( ):
+
+    def __init__( self ):
+
+        self.reset()
+
+    def reset( self ):
+
+        # settler_id -> int
+        self.index = {}
+
+        # int -> ( father, mother ), None when the parents are unknown
+        self.parents = []
+
+        # int -> [ int ] partners where the settler was `first`
+        self.partners = {}
+
+        # int -> frozenset of ancestors up to self.generations, the living only
+        self.ancestors = {}
+
+        self.generations = None
+
+    def load( self ):
+
+        self.reset()
+
+        for ( settler_id, father, mother ) in Settler.select(
+                Settler.settler_id,
+                Settler.biological_father,
+                Settler.biological_mother
+            ).where(
+                ( Settler.simulation_id == thisApp.simulation )
+            ).order_by(
+                Settler.id
+            ).tuples():
+
+            self.add_settler( settler_id, father, mother )
+
+        for ( first, second ) in Relationship.select(
+                Relationship.first,
+                Relationship.second
+            ).where(
+                ( Relationship.simulation_id == thisApp.simulation ) &
+                ( Relationship.relationship == RelationshipEnum.partner )
+            ).order_by(
+                Relationship.id
+            ).tuples():
+
+            self.add_partner( first, second )
+
+    def _intern( self, settler_id ):
+
+        settler_id = as_settler_id( settler_id )
+
+        i = self.index.get( settler_id )
+
+        if i is None:
+            i = len( self.parents )
+            self.index[settler_id] = i
+            self.parents.append( None )
+
+        return i
+
+    ##
+    # A settler has landed or been born
+    def add_settler( self, settler_id, father, mother ):
+
+        i = self._intern( settler_id )
+
+        self.parents[i] = ( self._intern( father ), self._intern( mother ) )
+
+    def add_partner( self, first, second ):
+
+        self.partners.setdefault( self._intern( first ), [] ).append( self._intern( second ) )
+
+    ##
+    # The number of partners the settler was `first` with, these
+    # are the only relatives that change during a settler's life
+    def partner_count( self, settler_id ):
+
+        i = self.index.get( as_settler_id( settler_id ) )
+
+        return len( self.partners.get( i, () ) )
+
+    ##
+    # The dead are never checked again, so forget their ancestors
+    def died( self, settler_id ):
+
+        i = self.index.get( as_settler_id( settler_id ) )
+
+        if i is not None:
+            self.ancestors.pop( i, None )
+
+    def _ancestors( self, i, generations ):
+
+        if self.generations != generations:
+            self.generations = generations
+            self.ancestors = {}
+
+        found = self.ancestors.get( i )
+
+        if found is not None:
+            return found
+
+        found = set()
+        generation = [ i ]
+
+        for _ in range( generations ):
+
+            parents = []
+
+            for g in generation:
+                if self.parents[g] is not None:
+                    parents.extend( self.parents[g] )
+
+            found.update( parents )
+            generation = parents
+
+        found = frozenset( found )
+
+        self.ancestors[i] = found
+
+        return found
+
+    ##
+    # \param generations - common_ancestor, 1 => parents, 2 => grandparents etc
+    # \return the interned ids of the settler's relatives
+    def relatives( self, settler_id, generations ):
+
+        i = self.index.get( as_settler_id( settler_id ) )
+
+        if i is None or generations < 0:
+            return frozenset()
+
+        return self._ancestors( i, generations ).union( self.partners.get( i, () ) )
+
+    def stats( self ):
+
+        return {
+            "settlers": len( self.parents ),
+            "partners": sum( len( p ) for p in self.partners.values() ),
+            "ancestor_sets": len( self.ancestors ),
+            "ancestors": sum( len( a ) for a in self.ancestors.values() ),
+        }
+
+
+PEDIGREE = Pedigree()
@@ -0,0 +1,258 @@
+## Copyright (c) 2019,2023 Richard Offer. All right reserved.
+#
+# see LICENSE.md for license details
+
+# Pluggable social policies on who may start a family
+
+import importlib
+import logging
+
+import numpy
+
+from censere.config import thisApp
+
+from .functions import family_policy as family_policy
+from .pedigree import PEDIGREE as PEDIGREE
+from .policy import POLICY_CACHE as POLICY_CACHE
+from .singles import SINGLES as SINGLES
+
+LOGGER = logging.getLogger("c.m.policies")
+DEVLOG = logging.getLogger("d.devel")
+
+##
+# A batch of candidate partnerships, as NumPy arrays
+# with one entry per pair - `first` is paired with `second`
+#
+class Pairs( ):
+
+    def __init__( self, first, second, first_birth, second_birth, first_sex, second_sex, first_orientation, second_orientation ):
+
+        # settler_ids
+        self.first = numpy.asarray( first, dtype=object )
+        self.second = numpy.asarray( second, dtype=object )
+
+        self.first_birth = numpy.asarray( first_birth, dtype=numpy.int64 )
+        self.second_birth = numpy.asarray( second_birth, dtype=numpy.int64 )
+
+        self.first_sex = numpy.asarray( first_sex, dtype=object )
+        self.second_sex = numpy.asarray( second_sex, dtype=object )
+
+        self.first_orientation = numpy.asarray( first_orientation, dtype=object )
+        self.second_orientation = numpy.asarray( second_orientation, dtype=object )
+
+    def __len__( self ):
+
+        return len( self.first )
+
+    ##
+    # Pairs of living settlers, described from the pool of singles
+    @staticmethod
+    def of_settlers( first, second ):
+
+        s1 = [ SINGLES.settlers[i] for i in first ]
+        s2 = [ SINGLES.settlers[i] for i in second ]
+
+        return Pairs(
+            first, second,
+            [ s[0] for s in s1 ], [ s[0] for s in s2 ],
+            [ s[2] for s in s1 ], [ s[2] for s in s2 ],
+            [ s[3] for s in s1 ], [ s[3] for s in s2 ] )
+
+    ##
+    # The pairs where `mask` is True
+    def subset( self, mask ):
+
+        return Pairs( *[ getattr( self, a )[mask] for a in (
+            "first", "second",
+            "first_birth", "second_birth",
+            "first_sex", "second_sex",
+            "first_orientation", "second_orientation" ) ] )
+
+
+##
+# A family policy is called with a batch of Pairs and
+# returns a boolean mask of the pairs that are allowed.
+#
+# The "legal" checks (ages, compatible orientations, both single)
+# have already been made, policies implement the softer rules.
+# A policy should be pure - the same pairs give the same mask
+# on the same sol - so the batch can be split up however the caller likes.
+#
+# allows() is the same check for a single pair, used by the SQL pairing,
+# override it when a policy has something cheaper than a batch of one.
+class Policy( ):
+
+    name = None
+
+    def __call__( self, pairs ):
+
+        return numpy.ones( len( pairs ), dtype=bool )
+
+    def allows( self, id_1, id_2 ):
+
+        return bool( self( Pairs.of_settlers( [ id_1 ], [ id_2 ] ) )[0] )
+
+##
+# No blood relatives closer than --common-ancestor, see family_policy()
+#
+# A batch is checked in NumPy: each side of the pairs is expanded to
+# ( pair, relative ) keys and a key on both sides is a shared relative.
+# Only the distinct settlers in the batch are looked up in the pedigree.
+# The refusals are recorded in POLICY_CACHE so they are kept across
+# --continue-simulation, the per pair cache lookups are left to allows().
+class Relatives( Policy ):
+
+    name = "relatives"
+
+    def __call__( self, pairs ):
+
+        generations = thisApp.common_ancestor
+
+        allowed = numpy.ones( len( pairs ), dtype=bool )
+
+        if len( pairs ) == 0:
+            return allowed
+
+        # interned ids are below this, so a key decodes back to its pair
+        stride = max( len( PEDIGREE.parents ), 1 )
+
+        shared = numpy.intersect1d(
+            Relatives._keys( pairs.first, generations, stride ),
+            Relatives._keys( pairs.second, generations, stride ),
+            assume_unique=True )
+
+        refused = numpy.unique( shared // stride )
+
+        allowed[refused] = False
+
+        for k in refused:
+            POLICY_CACHE.put( generations, pairs.first[k], pairs.second[k], False )
+
+        return allowed
+
+    ##
+    # \return pair * stride + relative for every relative of every settler
+    @staticmethod
+    def _keys( settlers, generations, stride ):
+
+        ( ids, inverse ) = numpy.unique( settlers, return_inverse=True )
+
+        relatives = [ numpy.fromiter( PEDIGREE.relatives( i, generations ), dtype=numpy.int64 ) for i in ids ]
+
+        lengths = numpy.array( [ len( r ) for r in relatives ], dtype=numpy.int64 )
+        starts = numpy.cumsum( lengths ) - lengths
+        flat = numpy.concatenate( relatives )
+
+        # how many relatives each pair has, and where each key sits among them
+        counts = lengths[inverse.ravel()]
+        offsets = numpy.arange( counts.sum() ) - numpy.repeat( numpy.cumsum( counts ) - counts, counts )
+
+        pair = numpy.repeat( numpy.arange( len( settlers ), dtype=numpy.int64 ), counts )
+
+        return pair * stride + flat[ numpy.repeat( starts[inverse.ravel()], counts ) + offsets ]
+
+    def allows( self, id_1, id_2 ):
+
+        return family_policy( thisApp.common_ancestor, id_1, id_2 )
+
+##
+# Only couples of opposite sexes
+class Heterosexual( Policy ):
+
+    name = "heterosexual"
+
+    def __call__( self, pairs ):
+
+        return pairs.first_sex != pairs.second_sex
+
+    def allows( self, id_1, id_2 ):
+
+        return SINGLES.settlers[id_1][2] != SINGLES.settlers[id_2][2]
+
+
+##
+# The built-in policies by name, more can be added with register_policy()
+# or named on the command line as `module.Class`
+POLICIES = {
+    Relatives.name: Relatives,
+    Heterosexual.name: Heterosexual,
+}
+
+def register_policy( cls ):
+
+    POLICIES[ cls.name ] = cls
+
+    return cls
+
+def _policy( name ):
+
+    cls = POLICIES.get( name )
+
+    if cls is None:
+
+        ( mod_name, _, cls_name ) = name.rpartition( "." )
+
+        if mod_name == "":
+            raise ValueError( f"Unknown family policy {name}" )
+
+        cls = getattr( importlib.import_module( mod_name ), cls_name )
+
+    return cls()
+
+##
+# The policies selected with --family-policies, all of them have to
+# allow a pair. Each policy only sees the pairs the earlier ones
+# allowed, so list the cheap ones first
+class FamilyPolicy( ):
+
+    def __init__( self, names=( "relatives", ) ):
+
+        self.select( names )
+
+    def select( self, names ):
+
+        if isinstance( names, str ):
+            names = [ n.strip() for n in names.split( "," ) if n.strip() != "" ]
+
+        self.policies = [ _policy( n ) for n in names ]
+
+    def __call__( self, pairs ):
+
+        mask = numpy.ones( len( pairs ), dtype=bool )
+
+        for policy in self.policies:
+
+            if not mask.any():
+                break
+
+            if mask.all():
+                mask = numpy.array( policy( pairs ), dtype=bool )
+            else:
+                mask[mask] = policy( pairs.subset( mask ) )
+
+        return mask
+
+    ##
+    # \param first, second - settler_ids of living settlers
+    # \return the mask of allowed pairs
+    def check( self, first, second ):
+
+        if len( first ) == 0:
+            return numpy.zeros( 0, dtype=bool )
+
+        return self( Pairs.of_settlers( first, second ) )
+
+    ##
+    # One pair, without building a batch
+    def allows( self, id_1, id_2 ):
+
+        return all( policy.allows( id_1, id_2 ) for policy in self.policies )
+
+
+FAMILY_POLICY = FamilyPolicy()
+
+##
+# The SQL pairing (see families.candidates_query()) checks one pair at a time
+def pair_policy( id_1, id_2 ):
+
+    return bool( FAMILY_POLICY.allows( id_1, id_2 ) )
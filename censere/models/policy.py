@@ -0,0 +1,204 @@
+## Copyright (c) 2019,2023 Richard Offer. All right reserved.
+#
+# see LICENSE.md for license details
+
+# Memo of family_policy() decisions
+
+import collections
+import logging
+
+import peewee
+import playhouse.signals
+
+import censere.db as DB
+
+from censere.config import thisApp
+
+from .pedigree import PEDIGREE as PEDIGREE
+
+LOGGER = logging.getLogger("c.m.policy")
+DEVLOG = logging.getLogger("d.devel")
+
+##
+# Pairs of settlers that family_policy() refused, these can never
+# become allowed so they are kept across --continue-simulation
+#
+class PolicyDecision( playhouse.signals.Model ):
+
+    class Meta:
+        database = DB.db
+
+        table_name = 'policy_cache'
+
+        indexes = (
+            (('simulation_id', 'common_ancestor', 'first', 'second'), True),
+        )
+
+    simulation_id = peewee.UUIDField()
+
+    common_ancestor = peewee.IntegerField()
+
+    # first < second
+    first = peewee.CharField( 32 )
+    second = peewee.CharField( 32 )
+
+    solday = peewee.IntegerField()
+
+
+##
+# Two tier cache of family_policy() decisions
+#
+# An LRU of up to `size` decisions in memory, backed by the
+# policy_cache table for the refusals.
+#
+# A settler's relatives only ever grow - ancestors are fixed at
+# birth and partners are added - so an overlap, once found, never
+# goes away and a refusal is kept for good. An allowed pair can be
+# refused later, but only after one of them gains a partner, so
+# those are tagged with both settlers' partner counts and ignored
+# once either has changed.
+class PolicyCache( ):
+
+    def __init__( self, size=65536 ):
+
+        self.size = size
+
+        self.reset()
+
+    def reset( self ):
+
+        # ( common_ancestor, first, second ) -> ( allowed, partners_first, partners_second )
+        self.entries = collections.OrderedDict()
+
+        # refusals not yet written to policy_cache
+        self.pending = []
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    ##
+    # Start warm with the most recent refusals for this simulation
+    def load( self, size=None ):
+
+        if size is not None:
+            self.size = size
+
+        self.reset()
+
+        if self.size <= 0:
+            return
+
+        rows = PolicyDecision.select(
+                PolicyDecision.common_ancestor,
+                PolicyDecision.first,
+                PolicyDecision.second
+            ).where(
+                ( PolicyDecision.simulation_id == thisApp.simulation )
+            ).order_by(
+                PolicyDecision.id.desc()
+            ).limit(
+                self.size
+            ).tuples()
+
+        # oldest first, so the most recent are the last evicted
+        for ( common_ancestor, first, second ) in reversed( list( rows ) ):
+
+            self.entries[ ( common_ancestor, first, second ) ] = ( False, None, None )
+
+    @staticmethod
+    def _key( common_ancestor, id_1, id_2 ):
+
+        # the policy doesn't depend on the order of the pair
+        if id_2 < id_1:
+            ( id_1, id_2 ) = ( id_2, id_1 )
+
+        return ( common_ancestor, id_1, id_2 )
+
+    ##
+    # \return the cached decision, or None if there isn't one
+    def get( self, common_ancestor, id_1, id_2 ):
+
+        if self.size <= 0:
+            return None
+
+        key = PolicyCache._key( common_ancestor, id_1, id_2 )
+
+        entry = self.entries.get( key )
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        ( allowed, partners_1, partners_2 ) = entry
+
+        if allowed and ( partners_1, partners_2 ) != ( PEDIGREE.partner_count( key[1] ), PEDIGREE.partner_count( key[2] ) ):
+
+            del self.entries[key]
+
+            self.invalidations += 1
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end( key )
+
+        self.hits += 1
+
+        return allowed
+
+    def put( self, common_ancestor, id_1, id_2, allowed ):
+
+        if self.size <= 0:
+            return
+
+        key = PolicyCache._key( common_ancestor, id_1, id_2 )
+
+        if allowed:
+            self.entries[key] = ( True, PEDIGREE.partner_count( key[1] ), PEDIGREE.partner_count( key[2] ) )
+        elif self.entries.get( key, ( True, ) )[0] is False:
+            # already refused, and written or waiting to be
+            pass
+        else:
+            self.entries[key] = ( False, None, None )
+
+            self.pending.append( {
+                "simulation_id": thisApp.simulation,
+                "common_ancestor": key[0],
+                "first": key[1],
+                "second": key[2],
+                "solday": thisApp.solday
+            } )
+
+        self.entries.move_to_end( key )
+
+        while len( self.entries ) > self.size:
+
+            self.entries.popitem( last=False )
+
+            self.evictions += 1
+
+    ##
+    # Write any new refusals to the policy_cache table,
+    # called as each block of sols is committed
+    def flush( self ):
+
+        for chunk in peewee.chunked( self.pending, 100 ):
+
+            PolicyDecision.insert_many( chunk ).on_conflict_ignore().execute()
+
+        self.pending = []
+
+    def stats( self ):
+
+        return {
+            "size": len( self.entries ),
+            "maxsize": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+POLICY_CACHE = PolicyCache()
@@ -18,6 +18,7 @@ import censere.db as DB
 
 
 from .settler import Settler as Settler
+from .colony import COLONY as COLONY
 
 ##
 # Collect population details
@@ -45,34 +46,78 @@ class Population(playhouse.signals.Model):
     sex = peewee.CharField( 1 )
     value = peewee.IntegerField( )
 
-def get_population_histogram( ):
+# don't forget these are solyears, so 50 is _old_
+BINS = [0,5,10,15,20,25,30,35,40,45,50]
 
+##
+# Bin edges (in solyears) from a comma separated list,
+# e.g. --population-bins
+def parse_bins( text ):
+
+    try:
+        bins = [ int( b ) for b in text.split( "," ) if b.strip() != "" ]
+    except ValueError:
+        raise ValueError( f"Population bins must be whole solyears, not {text}" )
+
+    if len( bins ) < 2 or any( b >= c for ( b, c ) in zip( bins, bins[1:] ) ) or bins[0] < 0:
+        raise ValueError( f"Population bins must be at least two increasing solyears, not {text}" )
+
+    return bins
+
+##
+# The living population by age and sex, as numpy.histogram() would give it
+# i.e. each bin includes its lower edge, the last one its upper edge too.
+#
+# With --engine=sql the ages are grouped (by whole solyear and sex) in the
+# query so only a row per age comes back, with --engine=memory they are
+# taken from the colony.
+#
+# \param bins - edges in solyears, the default is BINS
+# \return ( males, females ) each ( counts, edges )
+def get_population_histogram( bins=None ):
+
+    if bins is None:
+        bins = BINS
+
+    if COLONY.enabled:
+
+        ( ages, sexes ) = COLONY.ages()
+
+        years = ages // 668
+        counts = numpy.ones( len( years ), dtype=numpy.int64 )
+
+    else:
 
-    q = Settler.select( 
-            thisApp.solday - Settler.birth_solday,
-            Settler.sex
-        ).where( 
-            ( Settler.simulation_id == thisApp.simulation ) &
-            ( Settler.death_solday == 0 ) 
-        ).tuples()
+        # a solyear is still close to twice as long as an earth year...
+        solyears = ( ( thisApp.solday - Settler.birth_solday ) / 668 )
 
-    f = []
-    m = []
+        rows = list( Settler.select(
+                solyears,
+                Settler.sex,
+                peewee.fn.COUNT( 1 )
+            ).where(
+                ( Settler.simulation_id == thisApp.simulation ) &
+                ( Settler.death_solday == 0 )
+            ).group_by(
+                solyears,
+                Settler.sex
+            ).tuples() )
 
-    # convert from soldays to solyears
-    # a solyear is still close to twice as long as an earth year...
-    for i in q.execute():
+        years = numpy.array( [ r[0] for r in rows ], dtype=numpy.int64 )
+        sexes = numpy.array( [ r[1] for r in rows ], dtype=object )
+        counts = numpy.array( [ r[2] for r in rows ], dtype=numpy.int64 )
 
-        if i[1] == 'm':
-            m.append( int( i[0] / 668.0 ) )
-        else:
-            f.append( int( i[0] / 668.0 ) )
+    edges = numpy.asarray( bins, dtype=numpy.int64 )
 
+    # which bin each age is in, -1 if none
+    index = numpy.searchsorted( edges, years, side="right" ) - 1
+    index[ years == edges[-1] ] = len( edges ) - 2
+    index[ ( years < edges[0] ) | ( years > edges[-1] ) ] = -1
 
-    # don't forget these are solyears, so 50 is _old_
-    bins = [0,5,10,15,20,25,30,35,40,45,50]
-    males = numpy.histogram( m, bins=bins )
-    females = numpy.histogram( f, bins=bins )
+    keep = index >= 0
 
-    return ( males, females )
+    males = sexes == 'm'
 
+    return tuple(
+        ( numpy.bincount( index[ keep & mask ], weights=counts[ keep & mask ], minlength=len( edges ) - 1 ).astype( numpy.int64 ), edges )
+        for mask in ( males, ~males ) )
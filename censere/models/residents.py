@@ -0,0 +1,220 @@
+## Copyright (c) 2019,2023 Richard Offer. All right reserved.
+#
+# see LICENSE.md for license details
+
+# Identity map of the living settlers
+
+import logging
+
+import peewee
+
+from censere.config import thisApp
+
+import censere.utils as UTILS
+
+from .settler import Settler as Settler
+from .settler import as_settler_id as as_settler_id
+
+LOGGER = logging.getLogger("c.m.residents")
+DEVLOG = logging.getLogger("d.devel")
+
+##
+# The columns of a settler that the event handlers use
+class Resident( ):
+
+    FIELDS = (
+        "settler_id", "id", "first_name", "family_name", "sex", "orientation",
+        "state", "pregnant", "current_location", "birth_solday", "death_solday"
+    )
+
+    __slots__ = FIELDS
+
+    def __init__( self, *values ):
+
+        for ( k, v ) in zip( Resident.FIELDS, values ):
+            setattr( self, k, v )
+
+    def __repr__(self):
+        return "{} {} ({})".format( self.first_name, self.family_name, self.settler_id )
+
+    @staticmethod
+    def columns( ):
+
+        return [ getattr( Settler, f ) for f in Resident.FIELDS ]
+
+    @staticmethod
+    def of( instance ):
+
+        return Resident( *[ getattr( instance, f ) for f in Resident.FIELDS ] )
+
+
+##
+# The living settlers of this simulation, one Resident each, so that
+# the event handlers can look someone up by settler_id without a query.
+#
+# `state` is kept up to date by the domain events (see domain.py), as
+# is the census. Changes to `pregnant` are only made here, and written
+# back to the settlers table in one update per value by flush() - called
+# when the domain events are flushed.
+class Residents( ):
+
+    def __init__( self ):
+
+        self.reset()
+
+    def reset( self ):
+
+        # settler_id -> Resident
+        self.residents = {}
+
+        # settler_id -> pregnant, not yet written to the database
+        self.dirty = {}
+
+        # settler_id -> Resident of those that died since the last flush,
+        # their death isn't in the database yet
+        self.departed = {}
+
+    def load( self ):
+
+        self.reset()
+
+        for values in Settler.select(
+                *Resident.columns()
+            ).where(
+                ( Settler.simulation_id == thisApp.simulation ) &
+                ( Settler.death_solday == 0 )
+            ).tuples():
+
+            r = Resident( *values )
+
+            self.residents[r.settler_id] = r
+
+    ##
+    # A settler has been saved for the first time
+    def add( self, instance ):
+
+        self.residents[instance.settler_id] = Resident.of( instance )
+
+    def remove( self, settler_id ):
+
+        self.residents.pop( as_settler_id( settler_id ), None )
+
+    def died( self, settler_id, solday ):
+
+        r = self.residents.pop( as_settler_id( settler_id ), None )
+
+        if r is not None:
+            r.death_solday = solday
+            self.departed[r.settler_id] = r
+
+    ##
+    # \return the Resident, or None if they are dead (or unknown)
+    def get( self, settler_id ):
+
+        return self.residents.get( as_settler_id( settler_id ) )
+
+    ##
+    # Like get(), but the dead are read from the database (and not kept).
+    # Raises Settler.DoesNotExist if there is no such settler
+    def lookup( self, settler_id ):
+
+        r = self.get( settler_id )
+
+        if r is not None:
+            return r
+
+        r = self.departed.get( as_settler_id( settler_id ) )
+
+        if r is not None:
+            return r
+
+        return Resident( *Settler.select(
+                *Resident.columns()
+            ).where(
+                ( Settler.settler_id == as_settler_id( settler_id ) ) &
+                ( Settler.simulation_id == thisApp.simulation )
+            ).tuples().get() )
+
+    def set_state( self, state, *settler_ids ):
+
+        for i in settler_ids:
+
+            r = self.get( i )
+
+            if r is not None:
+                r.state = state
+
+    def set_pregnant( self, settler_id, pregnant ):
+
+        r = self.get( settler_id )
+
+        if r is not None:
+            r.pregnant = pregnant
+
+        self.dirty[ as_settler_id( settler_id ) ] = pregnant
+
+    ##
+    # Write the pregnancies out to the settlers table
+    def flush( self ):
+
+        for pregnant in ( True, False ):
+
+            ids = [ i for ( i, p ) in self.dirty.items() if p == pregnant ]
+
+            for chunk in peewee.chunked( ids, 500 ):
+
+                Settler.update(
+                    { Settler.pregnant: pregnant }
+                ).where(
+                    ( Settler.settler_id.in_( chunk ) ) &
+                    ( Settler.simulation_id == thisApp.simulation )
+                ).execute()
+
+        self.dirty = {}
+        self.departed = {}
+
+    ##
+    # Compare the residents to the database, logging any differences
+    #
+    # \return True if they match
+    def check( self ):
+
+        expected = Residents()
+
+        expected.load()
+
+        # pregnancies are allowed to be ahead of the database
+        for ( i, p ) in self.dirty.items():
+            if i in expected.residents:
+                expected.residents[i].pregnant = p
+
+        ok = True
+
+        for i in set( self.residents ) | set( expected.residents ):
+
+            mine = self.residents.get( i )
+            theirs = expected.residents.get( i )
+
+            if mine is None or theirs is None or any( getattr( mine, f ) != getattr( theirs, f ) for f in Resident.FIELDS ):
+
+                LOGGER.error( '%d.%03d (%d) Resident %s is %s, database has %s', *UTILS.from_soldays( thisApp.solday ), thisApp.solday, i,
+                    None if mine is None else [ getattr( mine, f ) for f in Resident.FIELDS ],
+                    None if theirs is None else [ getattr( theirs, f ) for f in Resident.FIELDS ] )
+
+                ok = False
+
+        if not ok:
+            self.residents = expected.residents
+
+        return ok
+
+    def stats( self ):
+
+        return {
+            "residents": len( self.residents ),
+            "dirty": len( self.dirty ),
+            "departed": len( self.departed ),
+        }
+
+
+RESIDENTS = Residents()
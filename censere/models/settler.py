@@ -14,6 +14,14 @@ import playhouse.signals
 
 import censere.db as DB
 
+##
+# \return `value` as a settler_id, Relationship.first/.second and
+# the biological parents are UUIDs once read back from the database
+def as_settler_id( value ):
+
+    return getattr( value, "hex", value )
+
+
 class LocationEnum():
     other = 'other'
     Earth = 'earth'
@@ -0,0 +1,284 @@
+## Copyright (c) 2019,2023 Richard Offer. All right reserved.
+#
+# see LICENSE.md for license details
+
+# The pool of singles that families.make() pairs from
+
+import bisect
+import logging
+
+import numpy
+
+from censere.config import thisApp
+
+import censere.utils as UTILS
+import censere.utils.random as RANDOM
+
+from .settler import Settler as Settler
+from .settler import as_settler_id as as_settler_id
+
+LOGGER = logging.getLogger("c.m.singles")
+DEVLOG = logging.getLogger("d.devel")
+
+##
+# The first of `partners` that the policy allows for `settler_id`.
+# They are checked in growing batches, so finding one near the front
+# doesn't cost checking every candidate
+def _first_allowed( settler_id, partners, allowed ):
+
+    start = 0
+    size = 8
+
+    while start < len( partners ):
+
+        batch = partners[ start : start + size ]
+
+        found = numpy.flatnonzero( allowed( [ settler_id ] * len( batch ), batch ) )
+
+        if len( found ) > 0:
+            return batch[ found[0] ]
+
+        start += size
+        size *= 2
+
+    return None
+
+##
+# The living singles of this simulation, kept in memory so that
+# finding a partner is a few sorted range scans instead of a
+# self-join of the settlers table.
+#
+# Singles are bucketed by (sex, orientation) and sorted by birth
+# solday, so the compatible partners within the age difference are
+# a slice of a few buckets. Children are included - coming of age
+# is just the upper bound of that slice.
+#
+# Kept up to date by the domain events (see domain.py), as is the census.
+class Singles( ):
+
+    def __init__( self ):
+
+        self.reset()
+
+    def reset( self ):
+
+        # every living settler, single or not
+        # settler_id -> ( birth_solday, id, sex, orientation, first_name, family_name )
+        self.settlers = {}
+
+        # (sex, orientation) -> sorted [ ( birth_solday, id, settler_id ) ]
+        self.buckets = {}
+
+        # settler_ids of the singles, sorted
+        self.singles = []
+
+    def load( self ):
+
+        self.reset()
+
+        for s in Settler.select(
+                Settler.settler_id,
+                Settler.birth_solday,
+                Settler.id,
+                Settler.sex,
+                Settler.orientation,
+                Settler.first_name,
+                Settler.family_name,
+                Settler.state
+            ).where(
+                ( Settler.simulation_id == thisApp.simulation ) &
+                ( Settler.death_solday == 0 )
+            ).tuples():
+
+            self.add( *s )
+
+    ##
+    # A new (living) settler
+    def add( self, settler_id, birth_solday, id, sex, orientation, first_name, family_name, state='single' ):
+
+        self.settlers[settler_id] = ( birth_solday, id, sex, orientation, first_name, family_name )
+
+        if state == 'single':
+            self._insert( settler_id )
+
+    def remove( self, settler_id ):
+
+        settler_id = as_settler_id( settler_id )
+
+        self._delete( settler_id )
+
+        self.settlers.pop( settler_id, None )
+
+    ##
+    # Partners that became a couple, ids of the dead are ignored
+    def paired( self, *settler_ids ):
+
+        for i in settler_ids:
+            self._delete( as_settler_id( i ) )
+
+    ##
+    # Partners that became single again, ids of the dead are ignored
+    def separated( self, *settler_ids ):
+
+        for i in settler_ids:
+            self._insert( as_settler_id( i ) )
+
+    def _insert( self, settler_id ):
+
+        s = self.settlers.get( settler_id )
+
+        if s is None:
+            return
+
+        i = bisect.bisect_left( self.singles, settler_id )
+
+        if i < len( self.singles ) and self.singles[i] == settler_id:
+            return
+
+        self.singles.insert( i, settler_id )
+
+        bisect.insort( self.buckets.setdefault( ( s[2], s[3] ), [] ), ( s[0], s[1], settler_id ) )
+
+    def _delete( self, settler_id ):
+
+        s = self.settlers.get( settler_id )
+
+        if s is None:
+            return
+
+        i = bisect.bisect_left( self.singles, settler_id )
+
+        if i == len( self.singles ) or self.singles[i] != settler_id:
+            return
+
+        del self.singles[i]
+
+        bucket = self.buckets[ ( s[2], s[3] ) ]
+
+        del bucket[ bisect.bisect_left( bucket, ( s[0], s[1], settler_id ) ) ]
+
+    ##
+    # The compatible partners for a single, in row id order
+    #
+    # \param adult_before - both must be born before this solday
+    # \param max_difference - birth soldays must be less than this apart
+    # \return [ ( id, settler_id ) ]
+    def partners( self, settler_id, adult_before, max_difference ):
+
+        ( birth_solday, id, sex, orientation ) = self.settlers[settler_id][:4]
+
+        if birth_solday >= adult_before:
+            return []
+
+        # strictly within the age difference, and an adult
+        low = ( birth_solday - max_difference, float("inf") )
+        high = ( min( birth_solday + max_difference, adult_before ), float("-inf") )
+
+        candidates = []
+
+        for ( ( partner_sex, partner_orientation ), bucket ) in self.buckets.items():
+
+            if partner_sex not in orientation or sex not in partner_orientation:
+                continue
+
+            for ( _, partner_id, partner ) in bucket[ bisect.bisect_right( bucket, low ) : bisect.bisect_left( bucket, high ) ]:
+
+                if partner != settler_id:
+                    candidates.append( ( partner_id, partner ) )
+
+        candidates.sort()
+
+        return candidates
+
+    ##
+    # The compatible partners of every single, found for the whole
+    # pool at once with UTILS.compatible_pairs(). For analysis, the
+    # pairing itself only looks up the singles it visits
+    #
+    # \return { settler_id: [ settler_id ] } partners in row id order,
+    #         singles without any are left out
+    def compatible( self, adult_before, max_difference ):
+
+        ids = sorted( self.singles, key=lambda i: self.settlers[i][1] )
+
+        ( first, second ) = UTILS.compatible_pairs(
+            [ self.settlers[i][0] for i in ids ],
+            [ self.settlers[i][2] for i in ids ],
+            [ self.settlers[i][3] for i in ids ],
+            adult_before,
+            max_difference )
+
+        bounds = numpy.searchsorted( first, numpy.arange( len( ids ) + 1 ) )
+
+        return {
+            ids[i]: [ ids[j] for j in second[ bounds[i] : bounds[i+1] ] ]
+                for i in range( len( ids ) ) if bounds[i] < bounds[i+1]
+        }
+
+    ##
+    # Find the first compatible pair of singles, in the same order
+    # as the SQL in families.candidates_query() - by settler_id and
+    # then by the partner's row id.
+    #
+    # \param allowed - the social policy, called with two lists of settler_ids
+    #                   and returning the mask of allowed pairs
+    # \return the two settler_ids or None
+    def find_pair( self, adult_before, max_difference, allowed ):
+
+        for settler_id in self.singles:
+
+            partner = _first_allowed( settler_id, [ p for ( _, p ) in self.partners( settler_id, adult_before, max_difference ) ], allowed )
+
+            if partner is not None:
+                return ( settler_id, partner )
+
+        return None
+
+    ##
+    # Randomized greedy matching, up to `count` disjoint pairs.
+    #
+    # Singles are visited in a random order, and each is paired with
+    # a random compatible (and still unmatched) partner.
+    #
+    # \return [ ( settler_id, settler_id ) ]
+    def match( self, count, adult_before, max_difference, allowed ):
+
+        pairs = []
+        matched = set()
+
+        # only the singles visited are looked up, so the cost
+        # follows `count` rather than the size of the pool
+        order = list( self.singles )
+        RANDOM.shuffle( order )
+
+        for settler_id in order:
+
+            if len( pairs ) >= count:
+                break
+
+            if settler_id in matched:
+                continue
+
+            candidates = [ p for ( _, p ) in self.partners( settler_id, adult_before, max_difference ) if p not in matched ]
+
+            RANDOM.shuffle( candidates )
+
+            partner = _first_allowed( settler_id, candidates, allowed )
+
+            if partner is not None:
+
+                pairs.append( ( settler_id, partner ) )
+                matched.update( ( settler_id, partner ) )
+
+        return pairs
+
+    ##
+    # The details families.make() needs about a settler
+    def details( self, settler_id ):
+
+        s = self.settlers[settler_id]
+
+        return { "sex": s[2], "first_name": s[4], "family_name": s[5] }
+
+
+SINGLES = Singles()
@@ -17,6 +17,7 @@ import censere.utils as UTILS
 
 from .settler import Settler as Settler
 from .settler import LocationEnum as LocationEnum
+from .colony import COLONY as COLONY
 
 ##
 # Collect summary details
@@ -63,118 +64,79 @@ class Summary(playhouse.signals.Model):
     earth_born = peewee.IntegerField( default=0 )
     mars_born = peewee.IntegerField( default=0 )
 
+    ##
+    # The columns counted by initialize(), each is the condition
+    # a settler on Mars (see counted()) has to meet to be counted.
+    #
+    # The conditions are written in terms of `c( name )`, a settler
+    # column, so the one definition is used both for the SQL query
+    # (where it is the Settler field, see query()) and for
+    # --engine=memory (where it is the NumPy column, see Colony.count()).
+    # Adding a metric is adding its column and an entry here.
+    @staticmethod
+    def metrics( c ):
+
+        alive = ( c( "death_solday" ) == 0 )
+        adult = ( c( "birth_solday" ) < ( thisApp.solday - UTILS.years_to_sols(18) ) )
+
+        return {
+            "adults": alive & adult,
+            "children": alive & ~adult,
+
+            "singles": alive & adult & ( c( "state" ) == 'single' ),
+            "couples": alive & adult & ( c( "state" ) == 'couple' ),
+
+            "males": alive & ( c( "sex" ) == 'm' ),
+            "females": alive & ( c( "sex" ) == 'f' ),
+
+            "hetrosexual": alive & adult & (
+                ( ( c( "sex" ) == 'm' ) & ( c( "orientation" ) == 'f' ) ) |
+                ( ( c( "sex" ) == 'f' ) & ( c( "orientation" ) == 'm' ) ) ),
+            "homosexual": alive & adult & ( c( "sex" ) == c( "orientation" ) ),
+            "bisexual": alive & adult & ( c( "orientation" ) == 'mf' ),
+
+            "deaths": ( c( "death_solday" ) != 0 ),
+
+            "earth_born": ( c( "birth_location" ) == LocationEnum.Earth ),
+            "mars_born": ( c( "birth_location" ) == LocationEnum.Mars ),
+        }
+
+    ##
+    # The settlers the metrics are counted over
+    @staticmethod
+    def counted( c ):
+
+        return ( c( "current_location" ) == LocationEnum.Mars )
+
+    ##
+    # One row with a column per metric, `SUM( CASE ... )` over the settlers.
+    # Kept separate so that `mars-censere db optimize` can explain it
+    @staticmethod
+    def query( ):
+
+        field = lambda name: getattr( Settler, name )
+
+        return Settler.select(
+                *[ peewee.fn.COALESCE( peewee.fn.SUM( peewee.Case( None, [ ( condition, 1 ) ], 0 ) ), 0 ).alias( k )
+                    for ( k, condition ) in Summary.metrics( field ).items() ]
+            ).where(
+                ( Settler.simulation_id == thisApp.simulation ) &
+                Summary.counted( field )
+            )
+
     def initialize( self):
 
-        adults = Settler.select().where( 
-            ( Settler.simulation_id == thisApp.simulation ) &
-            ( Settler.current_location == LocationEnum.Mars ) &
-            ( Settler.birth_solday < ( thisApp.solday - UTILS.years_to_sols(18) ) ) &
-            ( Settler.death_solday == 0 )
-        ).count()
-
-        children = Settler.select().where( 
-            ( Settler.simulation_id == thisApp.simulation ) &
-            ( Settler.current_location == LocationEnum.Mars ) &
-            ( Settler.birth_solday >= ( thisApp.solday - UTILS.years_to_sols(18) ) ) &
-            ( Settler.death_solday == 0 )
-        ).count()
-
-        singles = Settler.select().where( 
-            ( Settler.simulation_id == thisApp.simulation ) &
-            ( Settler.current_location == LocationEnum.Mars ) &
-            ( Settler.state == 'single' ) & 
-            ( Settler.birth_solday < ( thisApp.solday - UTILS.years_to_sols(18) ) ) & 
-            ( Settler.death_solday == 0 )
-        ).count()
-
-        couples = Settler.select().where( 
-            ( Settler.simulation_id == thisApp.simulation ) &
-            ( Settler.current_location == LocationEnum.Mars ) &
-            ( Settler.state == 'couple' ) & 
-            ( Settler.birth_solday < ( thisApp.solday - UTILS.years_to_sols(18) ) ) & 
-            ( Settler.death_solday == 0 )
-        ).count()
-
-        males = Settler.select().where( 
-            ( Settler.simulation_id == thisApp.simulation ) &
-            ( Settler.current_location == LocationEnum.Mars ) &
-            ( Settler.sex == 'm' ) & 
-            ( Settler.death_solday == 0 )
-        ).count()
-
-        females = Settler.select().where( 
-            ( Settler.simulation_id == thisApp.simulation ) &
-            ( Settler.current_location == LocationEnum.Mars ) &
-            ( Settler.sex == 'f' ) & 
-            ( Settler.death_solday == 0 )
-        ).count()
-
-        hetrosexual = Settler.select().where( 
-            ( Settler.simulation_id == thisApp.simulation ) &
-            ( Settler.current_location == LocationEnum.Mars ) &
-            ( ( ( Settler.sex == 'm' ) & 
-                ( Settler.orientation == 'f' ) ) | 
-            ( ( Settler.sex == 'f' ) & 
-                ( Settler.orientation == 'm' ) ) ) &
-            ( Settler.death_solday == 0 ) &
-            ( Settler.birth_solday < ( thisApp.solday - UTILS.years_to_sols(18) ) )
-        ).count()
-
-        homosexual = Settler.select().where( 
-            ( Settler.simulation_id == thisApp.simulation ) &
-            ( Settler.current_location == LocationEnum.Mars ) &
-            ( Settler.sex == Settler.orientation ) & 
-            ( Settler.death_solday == 0 ) &
-            ( Settler.birth_solday < ( thisApp.solday - UTILS.years_to_sols(18) ) )
-        ).count()
-
-        bisexual = Settler.select().where( 
-            ( Settler.simulation_id == thisApp.simulation ) &
-            ( Settler.current_location == LocationEnum.Mars ) &
-            ( Settler.orientation == 'mf' ) & 
-            ( Settler.death_solday == 0 ) &
-            ( Settler.birth_solday < ( thisApp.solday - UTILS.years_to_sols(18) ) )
-        ).count()
-
-        deaths = Settler.select().where( 
-            ( Settler.simulation_id == thisApp.simulation ) &
-            ( Settler.current_location == LocationEnum.Mars ) &
-            ( Settler.death_solday != 0 )
-        ).count()
-
-        earth_born = Settler.select().where( 
-            ( Settler.simulation_id == thisApp.simulation ) &
-            ( Settler.current_location == LocationEnum.Mars ) &
-            ( Settler.birth_location == LocationEnum.Earth )
-        ).count()
-
-        mars_born = Settler.select().where( 
-            ( Settler.simulation_id == thisApp.simulation ) &
-            ( Settler.current_location == LocationEnum.Mars ) &
-            ( Settler.birth_location == LocationEnum.Mars )
-        ).count()
+        if COLONY.enabled:
+            counts = COLONY.count( Summary.metrics, Summary.counted )
+        else:
+            counts = Summary.query().dicts().get()
 
         self.simulation_id = thisApp.simulation
 
         self.solday = thisApp.solday
         self.earth_datetime = thisApp.earth_time
-        self.adults = adults
-        self.children = children
-
-        self.males = males
-        self.females = females
-
-        self.hetrosexual = hetrosexual
-        self.homosexual = homosexual
-        self.bisexual = bisexual
-
-        self.population = adults + children
-
-        self.singles = singles
-        self.couples = couples
-
-        self.deaths = deaths
 
-        self.earth_born = earth_born
-        self.mars_born = mars_born
+        for ( k, v ) in counts.items():
+            setattr( self, k, v )
 
+        self.population = counts["adults"] + counts["children"]
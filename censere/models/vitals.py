@@ -0,0 +1,237 @@
+## Copyright (c) 2019,2023 Richard Offer. All right reserved.
+#
+# see LICENSE.md for license details
+
+# Running totals of births, deaths and partnerships, by solday
+
+import logging
+
+import peewee
+
+from censere.config import thisApp
+
+import censere.utils as UTILS
+
+from .settler import Settler as Settler
+from .settler import LocationEnum as LocationEnum
+from .relationship import Relationship as Relationship
+from .relationship import RelationshipEnum as RelationshipEnum
+from .summary import Summary as Summary
+
+LOGGER = logging.getLogger("c.m.vitals")
+DEVLOG = logging.getLogger("d.devel")
+
+##
+# Cumulative count of an event, `totals[d]` is how many
+# happened on or before solday d
+class Tally( ):
+
+    def __init__( self ):
+
+        self.totals = []
+
+    ##
+    # `count` more happened on `solday`, normally today
+    def add( self, solday, count=1 ):
+
+        if len( self.totals ) <= solday:
+            self.totals.extend( [ self.total( solday ) ] * ( solday + 1 - len( self.totals ) ) )
+
+        for d in range( solday, len( self.totals ) ):
+            self.totals[d] += count
+
+    ##
+    # \return how many happened on or before `solday`
+    def total( self, solday ):
+
+        if solday < 0 or len( self.totals ) == 0:
+            return 0
+
+        return self.totals[ min( solday, len( self.totals ) - 1 ) ]
+
+    ##
+    # \return how many happened after `after` and before `before`
+    def between( self, after, before ):
+
+        return max( self.total( before - 1 ) - self.total( after ), 0 )
+
+##
+# The vital statistics of this simulation - the Mars births, deaths and
+# partnerships started and ended - as running totals by solday,
+# so the number over any period is two lookups rather than a
+# range query, and the population etc. of each Summary.
+#
+# Kept up to date by the domain events (see domain.py), and by the
+# generator as it adds each summary.
+class VitalStatistics( ):
+
+    def __init__( self ):
+
+        self.reset()
+
+    def reset( self ):
+
+        self.births = Tally()
+        self.deaths = Tally()
+        self.started = Tally()
+        self.ended = Tally()
+
+        # relationship_id -> begin_solday of the active partnerships
+        self.active = {}
+
+        # solday -> [ begin_solday ] of the partnerships that ended on that solday,
+        # only the latest solday is kept
+        self.ended_on = {}
+
+        # solday -> { column: value } of each summary
+        self.summaries = {}
+
+    def load( self ):
+
+        self.reset()
+
+        for ( tally, column, query ) in (
+                ( self.births, Settler.birth_solday, Settler.select().where(
+                    ( Settler.simulation_id == thisApp.simulation ) &
+                    ( Settler.birth_location == LocationEnum.Mars ) ) ),
+                ( self.deaths, Settler.death_solday, Settler.select().where(
+                    ( Settler.simulation_id == thisApp.simulation ) &
+                    ( Settler.current_location == LocationEnum.Mars ) &
+                    ( Settler.death_solday != 0 ) ) ),
+                ( self.started, Relationship.begin_solday, Relationship.select().where(
+                    ( Relationship.simulation_id == thisApp.simulation ) &
+                    ( Relationship.relationship == RelationshipEnum.partner ) ) ),
+                ( self.ended, Relationship.end_solday, Relationship.select().where(
+                    ( Relationship.simulation_id == thisApp.simulation ) &
+                    ( Relationship.relationship == RelationshipEnum.partner ) &
+                    ( Relationship.end_solday != 0 ) ) ) ):
+
+            for ( solday, count ) in query.select(
+                    column,
+                    peewee.fn.COUNT( 1 )
+                ).group_by(
+                    column
+                ).order_by(
+                    column
+                ).tuples():
+
+                tally.add( solday, count )
+
+        for ( relationship_id, begin_solday ) in Relationship.select(
+                Relationship.relationship_id,
+                Relationship.begin_solday
+            ).where(
+                ( Relationship.simulation_id == thisApp.simulation ) &
+                ( Relationship.relationship == RelationshipEnum.partner ) &
+                ( Relationship.end_solday == 0 ) ).tuples():
+
+            self.active[relationship_id] = begin_solday
+
+        for s in Summary.select().where(
+                ( Summary.simulation_id == thisApp.simulation ) ):
+
+            self.summarized( s )
+
+    ##
+    # A settler has landed or been born
+    def added( self, instance ):
+
+        if instance.birth_location == LocationEnum.Mars:
+            self.births.add( instance.birth_solday )
+
+    def died( self, resident, solday ):
+
+        if resident.current_location == LocationEnum.Mars:
+            self.deaths.add( solday )
+
+    def partnership_started( self, relationship_id, solday ):
+
+        self.started.add( solday )
+
+        self.active[relationship_id] = solday
+
+    def partnership_ended( self, relationship_id, solday ):
+
+        self.ended.add( solday )
+
+        if solday not in self.ended_on:
+            self.ended_on = { solday: [] }
+
+        self.ended_on[solday].append( self.active.pop( relationship_id, solday ) )
+
+    def summarized( self, summary ):
+
+        self.summaries[summary.solday] = {
+            "population": summary.population,
+            "singles": summary.singles,
+            "couples": summary.couples,
+        }
+
+    ##
+    # \return the same values as Demographic.queries() for the period of
+    # `sols` up to today (a sol-year for the annual demographics)
+    def counts( self, sols=668 ):
+
+        solday = thisApp.solday
+
+        period_start = max( solday - sols, 0 )
+
+        # the partnerships that haven't ended, or ended before today,
+        # i.e. all except those ending today
+        ending_today = self.ended_on.get( solday, [] )
+
+        year_end = self.summaries[solday]
+
+        return {
+            "num_children_born": self.births.between( period_start, solday ),
+            "num_deaths": self.deaths.between( period_start, solday ),
+            "num_partnerships_started": self.started.between( period_start, solday ),
+            "num_partnerships_ended": self.ended.between( period_start, solday ),
+            "rel_year_start": self.started.total( period_start - 1 ) - sum( 1 for b in ending_today if b < period_start ),
+            "rel_year_end": self.started.total( solday - 1 ) - sum( 1 for b in ending_today if b < solday ),
+            # settlers never leave Mars, so these are today's summary
+            "num_single_settlers": year_end["singles"],
+            "num_partnered_settlers": year_end["couples"],
+        }
+
+    ##
+    # \return the population at the start of this sol-year and today
+    def populations( self ):
+
+        return (
+            self.summaries[ max( thisApp.solday - ( thisApp.solday % 668 ), 0 ) ]["population"],
+            self.summaries[ thisApp.solday ]["population"] )
+
+    ##
+    # Compare the running totals to the Demographic queries, logging
+    # any differences. Needs today's summary
+    #
+    # \return True if they match
+    def check( self, queries ):
+
+        mine = self.counts()
+
+        ok = True
+
+        for ( k, q ) in queries.items():
+
+            theirs = q.count()
+
+            if mine[k] != theirs:
+
+                LOGGER.error( '%d.%03d (%d) Vital statistics %s is %d, database has %d', *UTILS.from_soldays( thisApp.solday ), thisApp.solday, k, mine[k], theirs )
+
+                ok = False
+
+        return ok
+
+    def stats( self ):
+
+        return {
+            "sols": len( self.births.totals ),
+            "active": len( self.active ),
+            "summaries": len( self.summaries ),
+        }
+
+
+VITALS = VitalStatistics()
@@ -3,4 +3,5 @@
 from .sols import from_soldays as from_soldays
 from .earth import years_to_sols as years_to_sols
 from .earth import sols_to_age as sols_to_age
+from .pairs import compatible_pairs as compatible_pairs
 
@@ -0,0 +1,84 @@
+## Copyright (c) 2019,2023 Richard Offer. All right reserved.
+#
+# see LICENSE.md for license details
+#
+## Find who could partner with whom
+
+import numpy
+
+##
+# All the ordered pairs (i, j) of compatible settlers, i.e. both
+# adults, attracted to each other's sex and born less than
+# `max_difference` sols apart.
+#
+# Settlers are grouped by sex and sorted by birth solday, so each
+# settler's compatible partners are a window of each group that
+# numpy.searchsorted() finds, O(n log n) plus the number of pairs
+# rather than comparing every pair.
+#
+# The arguments are parallel sequences, one entry per settler,
+# e.g. the columns of a query on the settlers table.
+#
+# \param adult_before - both must be born before this solday
+# \return two int arrays, indexes into the arguments, sorted by i then j.
+#         Both (i, j) and (j, i) are included
+def compatible_pairs( births, sexes, orientations, adult_before, max_difference ):
+
+    births = numpy.asarray( births, dtype=numpy.int64 )
+    sexes = numpy.asarray( sexes, dtype=object )
+    orientations = numpy.asarray( orientations, dtype=object )
+
+    adults = numpy.flatnonzero( births < adult_before )
+
+    # sex -> indexes of the adults of that sex, sorted by birth
+    groups = {}
+
+    for sex in set( sexes[adults] ):
+
+        members = adults[ sexes[adults] == sex ]
+
+        groups[sex] = members[ numpy.argsort( births[members], kind="stable" ) ]
+
+    first = []
+    second = []
+
+    for ( sex, members ) in groups.items():
+
+        for ( partner_sex, partners ) in groups.items():
+
+            # attracted to each other
+            members_into = members[ numpy.fromiter( ( partner_sex in o for o in orientations[members] ), dtype=bool, count=len( members ) ) ]
+            partners_into = partners[ numpy.fromiter( ( sex in o for o in orientations[partners] ), dtype=bool, count=len( partners ) ) ]
+
+            if len( members_into ) == 0 or len( partners_into ) == 0:
+                continue
+
+            partner_births = births[partners_into]
+
+            # strictly within the age difference
+            low = numpy.searchsorted( partner_births, births[members_into] - max_difference, side="right" )
+            high = numpy.searchsorted( partner_births, births[members_into] + max_difference, side="left" )
+
+            counts = high - low
+
+            # expand each window [low, high) into the partner indexes
+            starts = numpy.repeat( low - ( numpy.cumsum( counts ) - counts ), counts )
+
+            first.append( numpy.repeat( members_into, counts ) )
+            second.append( partners_into[ starts + numpy.arange( counts.sum() ) ] )
+
+    if len( first ) == 0:
+        return ( numpy.zeros( 0, dtype=numpy.int64 ), numpy.zeros( 0, dtype=numpy.int64 ) )
+
+    first = numpy.concatenate( first )
+    second = numpy.concatenate( second )
+
+    # no self-partnering
+    keep = first != second
+
+    first = first[keep]
+    second = second[keep]
+
+    order = numpy.lexsort( ( second, first ) )
+
+    return ( first[order], second[order] )
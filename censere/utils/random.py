@@ -253,6 +253,29 @@ def random():
 
     return NPRND.random()
 
+##
+# Return the number of trials N (N >= 1) up to and including
+# the first success, when each trial succeeds with probability p
+#
+def geometric( p ):
+
+    return int( NPRND.geometric( p ) )
+
+##
+# Return the number of events in an interval when they
+# happen on average `lam` times per interval
+#
+def poisson( lam ):
+
+    return int( NPRND.poisson( lam ) )
+
+##
+# Shuffle the list in place
+#
+def shuffle( lst ):
+
+    NPRND.shuffle( lst )
+
 
 ## return a random number between start and stop
 #
@@ -0,0 +1,65 @@
+## Copyright (c) 2019,2023 Richard Offer. All right reserved.
+#
+# see LICENSE.md for license details
+
+# Compact journal form of event arguments
+
+import pytest
+
+import censere.events as EVENTS
+import censere.events.store as STORE
+
+
+def callback( **kwargs ):
+    pass
+
+@pytest.fixture
+def handler():
+
+    return STORE.Handler( 99, callback, ( ( "id", str ), ( "count", int ), ( "simulation", str ) ) )
+
+
+def test_round_trip( handler ):
+
+    kwargs = { "id": "0123456789abcdef", "count": 42, "simulation": "c0680972-af65-44fc-86d8-27932a0f297f" }
+
+    assert handler.decode( handler.encode( kwargs ) ) == kwargs
+
+def test_missing_values_round_trip( handler ):
+
+    assert handler.decode( handler.encode( { "count": 0 } ) ) == { "count": 0 }
+
+    assert handler.decode( handler.encode( { "id": None, "count": 7 } ) ) == { "count": 7 }
+
+@pytest.mark.parametrize( "kwargs", [
+    # not one of the fields
+    { "id": "a", "name": "b" },
+    # not the field's type
+    { "count": "42" },
+    { "count": 4.2 },
+    # can't be told apart from a missing value
+    { "id": "" },
+    # would split the value
+    { "id": "a" + STORE.Handler.SEPARATOR + "b" },
+] )
+def test_falls_back_to_json( handler, kwargs ):
+
+    assert handler.encode( kwargs ) is None
+
+def test_unregistered_falls_back_to_json( ):
+
+    assert STORE.Handler( 0, callback ).encode( { "id": "a" } ) is None
+
+def test_registered_handlers( ):
+
+    kwargs = { "biological_mother": "a" * 32, "biological_father": "b" * 32, "simulation": "c" * 32 }
+
+    handler = STORE.HANDLERS[2]
+
+    assert handler.callback_func is EVENTS.settler_born
+    assert handler.decode( handler.encode( kwargs ) ) == kwargs
+
+def test_codes_are_unique( ):
+
+    with pytest.raises( ValueError ):
+        STORE.register_handler( 1, callback, () )
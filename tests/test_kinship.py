@@ -0,0 +1,157 @@
+## Copyright (c) 2019,2023 Richard Offer. All right reserved.
+#
+# see LICENSE.md for license details
+
+# Kinship coefficients, checked against their recursive definition
+
+import functools
+import random
+
+import pytest
+
+import censere.models as MODELS
+
+
+@pytest.fixture
+def kinship():
+
+    k = MODELS.Kinship()
+
+    k.enabled = True
+
+    return k
+
+##
+# The textbook recursion, `order` is the birth order and `parents`
+# the ( father, mother ) of each settler, the founders have none
+def recursive( order, parents ):
+
+    @functools.lru_cache( maxsize=None )
+    def phi( a, b ):
+
+        if a not in order or b not in order:
+            return 0.0
+
+        if a == b:
+            return 0.5 * ( 1.0 + phi( *parents[a] ) )
+
+        # recurse on whoever was born last
+        if order[a] < order[b]:
+            ( a, b ) = ( b, a )
+
+        ( father, mother ) = parents[a]
+
+        return 0.5 * ( phi( father, b ) + phi( mother, b ) )
+
+    return phi
+
+
+def test_founders( kinship ):
+
+    kinship.add_settler( "f", "earth-1", "earth-2" )
+    kinship.add_settler( "m", "earth-3", "earth-4" )
+
+    assert kinship.kinship( "f", "f" ) == 0.5
+    assert kinship.kinship( "f", "m" ) == 0.0
+    assert kinship.kinship( "f", "unknown" ) == 0.0
+
+    # the founders aren't counted as births
+    assert kinship.report()["num_births"] == 0
+
+def test_siblings_after_the_father_dies( kinship ):
+
+    kinship.add_settler( "f", None, None )
+    kinship.add_settler( "m", None, None )
+
+    kinship.add_settler( "c1", "f", "m" )
+
+    kinship.died( "f" )
+
+    # a sibling is still to be born
+    kinship.expire( { "f", "m" } )
+
+    kinship.add_settler( "c2", "f", "m" )
+
+    assert kinship.kinship( "c1", "c2" ) == 0.25
+
+    kinship.expire()
+
+    assert kinship.stats()["settlers"] == 3
+    assert kinship.stats()["dead"] == 0
+
+def test_inbreeding( kinship ):
+
+    kinship.add_settler( "f", None, None )
+    kinship.add_settler( "m", None, None )
+
+    kinship.add_settler( "s", "f", "m" )
+    kinship.add_settler( "d", "f", "m" )
+
+    kinship.partnered( "s", "d" )
+
+    kinship.add_settler( "c", "s", "d" )
+
+    report = kinship.report()
+
+    assert report["num_partnerships"] == 1
+    assert report["max_partnership_kinship"] == 0.25
+
+    # the children of siblings
+    assert report["max_inbreeding"] == 0.25
+
+    assert kinship.report()["num_births"] == 0
+
+@pytest.mark.parametrize( "seed", range( 5 ) )
+def test_matches_recursion( kinship, seed ):
+
+    rnd = random.Random( seed )
+
+    order = {}
+    parents = {}
+
+    living = []
+
+    # ( father, mother ) of the births still to come
+    pending = []
+
+    def add( settler_id, father, mother ):
+
+        kinship.add_settler( settler_id, father, mother )
+
+        order[settler_id] = len( order )
+        parents[settler_id] = ( father, mother )
+
+        living.append( settler_id )
+
+    for i in range( 12 ):
+        add( f"founder-{i}", None, None )
+
+    for step in range( 400 ):
+
+        r = rnd.random()
+
+        if r < 0.3 and len( living ) >= 2:
+
+            pending.append( tuple( rnd.sample( living, 2 ) ) )
+
+        elif r < 0.7 and pending:
+
+            ( father, mother ) = pending.pop( rnd.randrange( len( pending ) ) )
+
+            add( f"settler-{step}", father, mother )
+
+        elif r < 0.85 and len( living ) > 2:
+
+            dead = living.pop( rnd.randrange( len( living ) ) )
+
+            kinship.died( dead )
+
+        else:
+
+            kinship.expire( set( p for pair in pending for p in pair ) )
+
+    phi = recursive( order, parents )
+
+    for a in living:
+        for b in living:
+            assert kinship.kinship( a, b ) == pytest.approx( phi( a, b ) )
@@ -0,0 +1,69 @@
+## Copyright (c) 2019,2023 Richard Offer. All right reserved.
+#
+# see LICENSE.md for license details
+
+# Compatible pairs, checked against comparing every pair
+
+import numpy
+import pytest
+
+import censere.utils.pairs as PAIRS
+
+
+##
+# The definition, one pair at a time
+def brute_force( births, sexes, orientations, adult_before, max_difference ):
+
+    pairs = []
+
+    for i in range( len( births ) ):
+        for j in range( len( births ) ):
+
+            if (
+                i != j and
+                births[i] < adult_before and births[j] < adult_before and
+                sexes[j] in orientations[i] and sexes[i] in orientations[j] and
+                abs( births[i] - births[j] ) < max_difference ):
+
+                pairs.append( ( i, j ) )
+
+    return pairs
+
+
+def test_none( ):
+
+    ( first, second ) = PAIRS.compatible_pairs( [], [], [], 100, 10 )
+
+    assert len( first ) == 0 and len( second ) == 0
+
+def test_age_difference_is_strict( ):
+
+    ( first, second ) = PAIRS.compatible_pairs( [ 0, 10, 9 ], [ 'm', 'f', 'f' ], [ 'f', 'm', 'm' ], 100, 10 )
+
+    assert list( zip( first, second ) ) == [ ( 0, 2 ), ( 2, 0 ) ]
+
+def test_adults_only( ):
+
+    ( first, second ) = PAIRS.compatible_pairs( [ 0, 5, 1 ], [ 'm', 'f', 'f' ], [ 'f', 'm', 'm' ], 5, 10 )
+
+    assert list( zip( first, second ) ) == [ ( 0, 2 ), ( 2, 0 ) ]
+
+@pytest.mark.parametrize( "seed", range( 20 ) )
+def test_matches_brute_force( seed ):
+
+    rnd = numpy.random.default_rng( seed )
+
+    n = int( rnd.integers( 1, 80 ) )
+
+    # few distinct births, so there are ties and pairs on the boundary
+    births = rnd.integers( 0, 60, n )
+    sexes = rnd.choice( [ 'm', 'f' ], n )
+    orientations = rnd.choice( [ 'm', 'f', 'mf' ], n )
+
+    adult_before = int( rnd.integers( 0, 70 ) )
+    max_difference = int( rnd.integers( 1, 30 ) )
+
+    ( first, second ) = PAIRS.compatible_pairs( births, sexes, orientations, adult_before, max_difference )
+
+    # sorted by i then j
+    assert list( zip( first.tolist(), second.tolist() ) ) == brute_force( births, sexes, orientations, adult_before, max_difference )
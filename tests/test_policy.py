@@ -0,0 +1,154 @@
+## Copyright (c) 2019,2023 Richard Offer. All right reserved.
+#
+# see LICENSE.md for license details
+
+# Two tier cache of family policy decisions
+
+import pytest
+
+from censere.config import thisApp
+
+import censere.models as MODELS
+
+
+@pytest.fixture
+def cache( monkeypatch ):
+
+    monkeypatch.setattr( thisApp, "simulation", "c0680972-af65-44fc-86d8-27932a0f297f", raising=False )
+    monkeypatch.setattr( thisApp, "solday", 100, raising=False )
+
+    MODELS.PEDIGREE.reset()
+
+    for i in ( "a", "b", "c", "d" ):
+        MODELS.PEDIGREE.add_settler( i, None, None )
+
+    yield MODELS.PolicyCache( 2 )
+
+    MODELS.PEDIGREE.reset()
+
+
+def test_miss( cache ):
+
+    assert cache.get( 3, "a", "b" ) is None
+
+    assert cache.stats()["misses"] == 1
+
+def test_either_order( cache ):
+
+    cache.put( 3, "b", "a", False )
+
+    assert cache.get( 3, "a", "b" ) is False
+    assert cache.get( 3, "b", "a" ) is False
+
+    # a different policy
+    assert cache.get( 2, "a", "b" ) is None
+
+def test_refusals_are_kept( cache ):
+
+    cache.put( 3, "a", "b", False )
+    cache.put( 3, "a", "c", True )
+
+    assert cache.pending == [ {
+        "simulation_id": thisApp.simulation,
+        "common_ancestor": 3,
+        "first": "a",
+        "second": "b",
+        "solday": 100
+    } ]
+
+    # refusals still stand once either has a partner
+    MODELS.PEDIGREE.add_partner( "a", "d" )
+
+    assert cache.get( 3, "a", "b" ) is False
+
+def test_allowed_until_a_partner( cache ):
+
+    cache.put( 3, "a", "b", True )
+
+    assert cache.get( 3, "a", "b" ) is True
+
+    MODELS.PEDIGREE.add_partner( "b", "c" )
+
+    assert cache.get( 3, "a", "b" ) is None
+
+    assert cache.stats()["invalidations"] == 1
+
+def test_least_recently_used( cache ):
+
+    cache.put( 3, "a", "b", False )
+    cache.put( 3, "a", "c", False )
+
+    # now the most recent
+    assert cache.get( 3, "a", "b" ) is False
+
+    cache.put( 3, "a", "d", False )
+
+    assert cache.get( 3, "a", "c" ) is None
+    assert cache.get( 3, "a", "b" ) is False
+    assert cache.get( 3, "a", "d" ) is False
+
+    assert cache.stats()["evictions"] == 1
+
+def test_disabled( cache ):
+
+    cache.size = 0
+
+    cache.put( 3, "a", "b", False )
+
+    assert cache.get( 3, "a", "b" ) is None
+    assert cache.pending == []
+
+def test_refused_once( cache ):
+
+    cache.put( 3, "a", "b", False )
+    cache.put( 3, "b", "a", False )
+
+    assert len( cache.pending ) == 1
+
+
+@pytest.mark.parametrize( "seed", [ 1, 2, 3 ] )
+def test_relatives_match_family_policy( monkeypatch, seed ):
+
+    import numpy
+
+    import censere.models.functions as FUNC
+    import censere.models.policies as POLICIES
+
+    monkeypatch.setattr( thisApp, "common_ancestor", 2, raising=False )
+    monkeypatch.setattr( MODELS.POLICY_CACHE, "size", 0 )
+
+    rng = numpy.random.default_rng( seed )
+
+    # a few founders, then children of random couples so there are
+    # siblings, cousins and partners
+    MODELS.PEDIGREE.reset()
+
+    settlers = [ f"f{i}" for i in range( 8 ) ]
+
+    for s in settlers:
+        MODELS.PEDIGREE.add_settler( s, None, None )
+
+    for i in range( 60 ):
+        ( father, mother ) = rng.choice( settlers, 2, replace=False )
+        settlers.append( f"c{i}" )
+        MODELS.PEDIGREE.add_settler( f"c{i}", father, mother )
+
+        if rng.random() < 0.3:
+            MODELS.PEDIGREE.add_partner( father, mother )
+
+    # a settler the pedigree doesn't know
+    settlers.append( "stranger" )
+
+    first = list( rng.choice( settlers, 400 ) )
+    second = list( rng.choice( settlers, 400 ) )
+
+    pairs = MODELS.Pairs( first, second, [0] * 400, [0] * 400, ["m"] * 400, ["f"] * 400, ["h"] * 400, ["h"] * 400 )
+
+    expected = [ FUNC.family_policy( 2, a, b ) for ( a, b ) in zip( first, second ) ]
+
+    assert list( POLICIES.Relatives()( pairs ) ) == expected
+
+    # and the single pair check used by the SQL pairing
+    assert [ POLICIES.Relatives().allows( a, b ) for ( a, b ) in zip( first, second ) ] == expected
+
+    MODELS.PEDIGREE.reset()
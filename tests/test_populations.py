@@ -0,0 +1,162 @@
+## Copyright (c) 2019,2023 Richard Offer. All right reserved.
+#
+# see LICENSE.md for license details
+
+# Population pyramid bins
+
+import types
+
+import numpy
+import pytest
+
+from censere.config import thisApp
+
+import censere.db as DB
+
+import censere.models as MODELS
+import censere.models.populations as POPULATIONS
+
+
+def test_parse_bins( ):
+
+    assert MODELS.parse_population_bins( "0,5,10" ) == [ 0, 5, 10 ]
+    assert MODELS.parse_population_bins( " 0, 18 ,65, " ) == [ 0, 18, 65 ]
+
+@pytest.mark.parametrize( "text", [ "", "5", "0,5,5", "10,5", "-5,0", "0,5.5", "0,five" ] )
+def test_parse_bad_bins( text ):
+
+    with pytest.raises( ValueError ):
+        MODELS.parse_population_bins( text )
+
+##
+# With --engine=memory the ages come from the colony
+@pytest.fixture
+def colony( monkeypatch ):
+
+    monkeypatch.setattr( thisApp, "solday", 100 * 668, raising=False )
+
+    colony = MODELS.Colony()
+    colony.enabled = True
+
+    monkeypatch.setattr( POPULATIONS, "COLONY", colony )
+
+    return colony
+
+def add( colony, i, birth_solday, sex, death_solday=0 ):
+
+    colony.add( types.SimpleNamespace(
+        settler_id=f"settler-{i}",
+        birth_solday=birth_solday,
+        death_solday=death_solday,
+        sex=sex,
+        orientation='mf',
+        state='single',
+        birth_location=MODELS.LocationEnum.Mars,
+        current_location=MODELS.LocationEnum.Mars,
+        biological_father=None,
+        biological_mother=None,
+        cohort=0 ) )
+
+@pytest.mark.parametrize( "bins", [ POPULATIONS.BINS, [ 0, 18, 65 ], [ 10, 20 ] ] )
+def test_matches_numpy_histogram( colony, bins ):
+
+    rnd = numpy.random.default_rng( 1 )
+
+    ages = []
+
+    for i in range( 500 ):
+
+        # whole solyears, including those on and beyond the edges
+        age = int( rnd.integers( 0, 70 * 668 ) )
+        sex = str( rnd.choice( [ 'm', 'f' ] ) )
+
+        dead = rnd.random() < 0.2
+
+        add( colony, i, thisApp.solday - age, sex, death_solday=thisApp.solday if dead else 0 )
+
+        if not dead:
+            ages.append( ( age // 668, sex ) )
+
+    for edge in bins:
+        add( colony, f"edge-{edge}", thisApp.solday - edge * 668, 'f' )
+        ages.append( ( edge, 'f' ) )
+
+    ( males, females ) = MODELS.get_population_histogram( bins )
+
+    for ( sex, ( counts, edges ) ) in ( ( 'm', males ), ( 'f', females ) ):
+
+        ( expected, expected_edges ) = numpy.histogram( [ a for ( a, s ) in ages if s == sex ], bins=bins )
+
+        assert counts.tolist() == expected.tolist()
+        assert edges.tolist() == expected_edges.tolist()
+
+##
+# With --engine=sql the ages are grouped in the query
+@pytest.fixture
+def database( monkeypatch ):
+
+    monkeypatch.setattr( thisApp, "solday", 100 * 668, raising=False )
+    monkeypatch.setattr( thisApp, "simulation", "c0680972-af65-44fc-86d8-27932a0f297f", raising=False )
+
+    monkeypatch.setattr( POPULATIONS, "COLONY", MODELS.Colony() )
+
+    DB.open_database( ":memory:" )
+    DB.db.create_tables( [ MODELS.Settler ] )
+
+    yield DB.db
+
+    DB.db.close()
+
+def insert( i, birth_solday, sex, death_solday=0, simulation=None ):
+
+    MODELS.Settler.insert(
+        simulation_id=simulation or thisApp.simulation,
+        settler_id=f"settler-{i}",
+        sex=sex,
+        first_name="First",
+        family_name="Family",
+        biological_father="",
+        biological_mother="",
+        orientation='mf',
+        birth_location=MODELS.LocationEnum.Mars,
+        current_location=MODELS.LocationEnum.Mars,
+        birth_solday=birth_solday,
+        death_solday=death_solday ).execute()
+
+@pytest.mark.parametrize( "bins", [ POPULATIONS.BINS, [ 0, 18, 65 ], [ 10, 20 ] ] )
+def test_query_matches_numpy_histogram( database, bins ):
+
+    rnd = numpy.random.default_rng( 2 )
+
+    ages = []
+
+    for i in range( 500 ):
+
+        age = int( rnd.integers( 0, 70 * 668 ) )
+        sex = str( rnd.choice( [ 'm', 'f' ] ) )
+
+        dead = rnd.random() < 0.2
+
+        insert( i, thisApp.solday - age, sex, death_solday=thisApp.solday if dead else 0 )
+
+        if not dead:
+            ages.append( ( age // 668, sex ) )
+
+    for edge in bins:
+        # on the edge, and a sol either side of it
+        for ( j, age ) in enumerate( ( edge * 668 - 1, edge * 668, edge * 668 + 1 ) ):
+            if age >= 0:
+                insert( f"edge-{edge}-{j}", thisApp.solday - age, 'm' )
+                ages.append( ( age // 668, 'm' ) )
+
+    # another simulation isn't counted
+    insert( "other", thisApp.solday - 668, 'f', simulation="5e1bd1b9-2b6c-4a6e-9d1c-1f1f6a0f6c3e" )
+
+    ( males, females ) = MODELS.get_population_histogram( bins )
+
+    for ( sex, ( counts, edges ) ) in ( ( 'm', males ), ( 'f', females ) ):
+
+        ( expected, expected_edges ) = numpy.histogram( [ a for ( a, s ) in ages if s == sex ], bins=bins )
+
+        assert counts.tolist() == expected.tolist()
+        assert edges.tolist() == expected_edges.tolist()
@@ -0,0 +1,83 @@
+## Copyright (c) 2019,2023 Richard Offer. All right reserved.
+#
+# see LICENSE.md for license details
+
+# Batch matching from the pool of singles
+
+import numpy
+import pytest
+
+import censere.models as MODELS
+import censere.utils.random as RANDOM
+
+
+def everyone( first, second ):
+
+    return numpy.ones( len( first ), dtype=bool )
+
+##
+# A large pool where every man and woman of similar age is compatible
+@pytest.fixture
+def singles( monkeypatch ):
+
+    RANDOM.seed( 1 )
+
+    singles = MODELS.Singles()
+
+    for i in range( 4000 ):
+
+        ( sex, orientation ) = ( 'm', 'f' ) if i % 2 else ( 'f', 'm' )
+
+        singles.add( f"{i:032x}", i % 500, i + 1, sex, orientation, "first", "family" )
+
+    # the number of singles looked up, and the candidates found for them
+    singles.visited = 0
+    singles.examined = 0
+
+    partners = singles.partners
+
+    def counted( *args ):
+
+        found = partners( *args )
+
+        singles.visited += 1
+        singles.examined += len( found )
+
+        return found
+
+    monkeypatch.setattr( singles, "partners", counted )
+
+    # the whole pool must never be paired up
+    def compatible( *args ):
+        raise AssertionError( "match() built every compatible pair" )
+
+    monkeypatch.setattr( singles, "compatible", compatible )
+
+    return singles
+
+
+def test_disjoint_pairs( singles ):
+
+    pairs = singles.match( 5, 1000, 100, everyone )
+
+    assert len( pairs ) == 5
+    assert len( set( i for pair in pairs for i in pair ) ) == 10
+
+    for ( first, second ) in pairs:
+        assert singles.settlers[first][2] != singles.settlers[second][2]
+
+@pytest.mark.parametrize( "count", [ 1, 5, 20 ] )
+def test_cost_follows_count( singles, count ):
+
+    singles.match( count, 1000, 100, everyone )
+
+    # each single visited is matched, unless their partner already was
+    assert singles.visited <= 2 * count
+
+    # only the age window of those visited - 200 birth soldays of
+    # 8 singles each - not the pool
+    assert singles.examined <= singles.visited * 200 * 8
+
+def test_no_pairs( singles ):
+
+    assert singles.match( 5, 1000, 100, lambda first, second: numpy.zeros( len( first ), dtype=bool ) ) == []
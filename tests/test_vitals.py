@@ -0,0 +1,67 @@
+## Copyright (c) 2019,2023 Richard Offer. All right reserved.
+#
+# see LICENSE.md for license details
+
+# Running totals by solday
+
+import random
+
+import pytest
+
+import censere.models as MODELS
+
+
+def test_empty( ):
+
+    tally = MODELS.Tally()
+
+    assert tally.total( 0 ) == 0
+    assert tally.total( 100 ) == 0
+    assert tally.between( 0, 100 ) == 0
+
+def test_total( ):
+
+    tally = MODELS.Tally()
+
+    tally.add( 3 )
+    tally.add( 3 )
+    tally.add( 7, 5 )
+
+    assert [ tally.total( d ) for d in range( -1, 10 ) ] == [ 0, 0, 0, 0, 2, 2, 2, 2, 7, 7, 7 ]
+
+def test_between_excludes_both_ends( ):
+
+    tally = MODELS.Tally()
+
+    for d in ( 10, 11, 20, 21 ):
+        tally.add( d )
+
+    assert tally.between( 10, 21 ) == 2
+    assert tally.between( 9, 22 ) == 4
+    assert tally.between( 20, 20 ) == 0
+
+@pytest.mark.parametrize( "seed", range( 5 ) )
+def test_matches_counting( seed ):
+
+    rnd = random.Random( seed )
+
+    tally = MODELS.Tally()
+
+    events = []
+
+    for _ in range( 300 ):
+
+        # mostly today, sometimes loaded out of order
+        solday = len( events ) // 3 if rnd.random() < 0.9 else rnd.randrange( 200 )
+        count = rnd.randrange( 1, 4 )
+
+        tally.add( solday, count )
+        events.append( ( solday, count ) )
+
+    for _ in range( 200 ):
+
+        after = rnd.randrange( -5, 220 )
+        before = rnd.randrange( -5, 220 )
+
+        assert tally.total( before ) == sum( c for ( d, c ) in events if d <= before )
+        assert tally.between( after, before ) == sum( c for ( d, c ) in events if after < d < before )